@@ -1,10 +1,55 @@
 from langgraph.graph import StateGraph, START, END
-from typing import TypedDict, List, Optional, Annotated
-from tools.gmail_tools import fetch_unread_emails, create_draft, mark_as_read
-from tools.llm_tools import analyze_email, generate_response
+from typing import TypedDict, List, Optional, Annotated, Iterator
+from tools.gmail_tools import (
+    fetch_unread_emails, iter_unread_emails, fetch_new_emails, fetch_unread_threads,
+    mark_email_as_read, load_bodies
+)
+from tools.draft_writer import DraftWriter
+from tools.label_buffer import LabelBuffer
+from tools.llm_tools import (
+    analyze_email, analyze_and_respond, generate_response, process_emails_concurrently
+)
 from utils.gmail_auth import get_gmail_service
+from tools.llm_cache import LLMCache
+from tools.triage_rules import load_triage_rules, triage_email, log_triage_decision
+from utils.message_store import MessageStore
+from config.settings import (
+    MAX_EMAILS_PER_RUN, STREAM_EMAILS, INCREMENTAL_SYNC, LAZY_BODY, THREAD_MODE, GMAIL_BATCH_SIZE,
+    SYNC_STATE_FILE, MESSAGE_STORE_DIR, MESSAGE_STORE_MAX_MB, FUSED_LLM, LLM_CONCURRENCY,
+    BATCH_ANALYSIS_SIZE, LLM_CACHE_FILE, PRE_TRIAGE, TRIAGE_RULES_FILE, TRIAGE_LOG_FILE
+)
 import operator
 
+# Created on first use, not at import: importing the agent mustn't create
+# files (the paths are relative to the directory the bot runs in)
+_message_store = None
+_llm_cache = None
+_triage_rules = None
+
+
+def get_message_store():
+    """Downloaded messages, kept on disk so reruns don't fetch them again."""
+    global _message_store
+    if _message_store is None:
+        _message_store = MessageStore(MESSAGE_STORE_DIR, max_bytes=MESSAGE_STORE_MAX_MB * 1024 * 1024)
+    return _message_store
+
+
+def get_llm_cache():
+    """LLM results for emails already seen, shared by every run in this process."""
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMCache(LLM_CACHE_FILE)
+    return _llm_cache
+
+
+def get_triage_rules():
+    """Pre-triage rules, loaded once."""
+    global _triage_rules
+    if _triage_rules is None:
+        _triage_rules = load_triage_rules(TRIAGE_RULES_FILE) if PRE_TRIAGE else {'enabled': False}
+    return _triage_rules
+
 class EmailAgentState(TypedDict):
     """State for email automation agent."""
     # In LangGraph, a state is the data object that moves through your graph —
@@ -15,13 +60,18 @@ class EmailAgentState(TypedDict):
     # Defining the state fields
 
     emails: List[dict]  # All fetched emails
+    email_stream: Optional[Iterator[dict]]  # Lazily fetched emails (streaming mode)
     current_index: int  # Which email we're on
+    label_buffer: Optional[LabelBuffer]  # Label changes applied in bulk
+    draft_writer: Optional[DraftWriter]  # Drafts created in batches
+    llm_results: Optional[dict]  # Email ID -> analysis/draft computed up front
 
     # Optional[dict] This means:
     # current_email can be a dictionary when an email is selected
     # or None before any email is loaded
     
     current_email: Optional[dict]  # The email being processed
+    triage_reason: Optional[str]  # Pre-triage rule that matched (skip without the LLM)
     analysis: Optional[dict]  # LLM analysis
     draft_response: str  # Generated response
     user_approved: bool  # Did user approve?
@@ -36,12 +86,79 @@ def fetch_email_node(state : EmailAgentState) -> dict:
         dict: State updates with fetched emails
     """
     service = get_gmail_service()
-    result = fetch_unread_emails(service, max_results=5)
+
+    # Mark-as-read changes are collected and sent together at the end of the run
+    label_buffer = LabelBuffer(service)
+
+    # Drafts are queued and created in batches; an email is marked as read
+    # once its draft exists
+    def on_draft_result(result):
+        if result['error'] is None:
+            mark_email_as_read(service, result['context'], buffer=label_buffer)
+
+    draft_writer = DraftWriter(service, on_result=on_draft_result)
+
+    if STREAM_EMAILS:
+        # Emails are pulled one at a time by select_email_node
+        stream = iter_unread_emails(service, max_in_flight=GMAIL_BATCH_SIZE,
+                                    store=get_message_store(), lazy_body=LAZY_BODY)
+        return {
+            'emails': [],
+            'email_stream': stream,
+            'label_buffer': label_buffer,
+            'draft_writer': draft_writer,
+            'current_index': 0,
+            'messages': ['Streaming unread emails']}
+
+    if THREAD_MODE:
+        # One email per conversation, with the earlier messages as context
+        result = fetch_unread_threads(service, max_results=MAX_EMAILS_PER_RUN,
+                                      store=get_message_store())
+    elif INCREMENTAL_SYNC:
+        result = fetch_new_emails(service, SYNC_STATE_FILE, max_results=MAX_EMAILS_PER_RUN,
+                                  store=get_message_store(), lazy_body=LAZY_BODY)
+    else:
+        result = fetch_unread_emails(service, max_results=MAX_EMAILS_PER_RUN,
+                                     store=get_message_store(), lazy_body=LAZY_BODY)
 
     return {
         'emails': result,
+        'label_buffer': label_buffer,
+        'draft_writer': draft_writer,
         'current_index':0,
-        'messages':['Fetched 5 emails']}
+        'messages':[f'Fetched {len(result)} emails']}
+
+
+def prepare_llm_node(state: EmailAgentState) -> dict:
+    """
+    Run the LLM steps for all fetched emails up front, concurrently
+    (LLM_CONCURRENCY > 1) and/or several emails per request (BATCH_ANALYSIS_SIZE > 1).
+
+    The per-email nodes then pick up the finished analysis and draft
+    instead of waiting on the LLM one email at a time.
+
+    Returns:
+        dict: State updates with precomputed LLM results
+    """
+    # Emails the pre-triage rules will skip never reach the LLM
+    emails = [email for email in state['emails'] if not triage_email(email, get_triage_rules())]
+    if (LLM_CONCURRENCY <= 1 and BATCH_ANALYSIS_SIZE <= 1) or not emails:
+        return {'llm_results': None}
+
+    # Lazy bodies are downloaded here in a few batch requests; read on the
+    # LLM event loop, each would block every other request while it loads
+    if LAZY_BODY:
+        load_bodies(get_gmail_service(), emails, batch_size=GMAIL_BATCH_SIZE, store=get_message_store())
+
+    results = {}
+    for result in process_emails_concurrently(emails, LLM_CONCURRENCY, fused=FUSED_LLM,
+                                              cache=get_llm_cache()):
+        results[result['email']['id']] = result
+
+    return {
+        'llm_results': results,
+        'messages': [f'Analyzed {len(results)} emails up front']
+    }
 
 
 def select_email_node(state: EmailAgentState) -> dict:
@@ -55,6 +172,17 @@ def select_email_node(state: EmailAgentState) -> dict:
     emails = state['emails']
     index = state['current_index']
 
+    # Streaming mode: pull the next email, nothing is kept after it's processed
+    stream = state.get('email_stream')
+    if stream is not None:
+        email = next(stream, None)
+        if email is None:
+            return {'current_email': None, 'messages': _finish_run(state)}
+        return {
+            'current_email': email,
+            'messages': [f'Proccessing email {index+1}']
+            }
+
     # 2. Check if index is valid (within list bounds)
     if index < len(emails):
 
@@ -64,7 +192,59 @@ def select_email_node(state: EmailAgentState) -> dict:
           'messages': [f'Proccessing email {index+1}/{len(emails)}']
           }
     else:
-      return {'current_email': None}
+      return {'current_email': None, 'messages': _finish_run(state)}
+
+
+def _finish_run(state: EmailAgentState) -> list:
+    """
+    Create the queued drafts and apply the collected label changes.
+
+    Returns:
+        list: Status messages with the outcome of each draft
+    """
+    messages = []
+
+    draft_writer = state.get('draft_writer')
+    if draft_writer is not None:
+        for result in draft_writer.close():
+            subject = result['context']['subject']
+            if result['error'] is None:
+                messages.append(f"Draft created for: {subject}")
+            else:
+                messages.append(f"Draft failed for: {subject} ({result['error']})")
+
+    label_buffer = state.get('label_buffer')
+    if label_buffer is not None:
+        label_buffer.close()
+
+    return messages
+
+
+def triage_email_node(state: EmailAgentState) -> dict:
+    """
+    Check the current email against the pre-triage rules.
+
+    Newsletters, no-reply senders, bulk mail and calendar notifications
+    are recognized from their headers and skipped without an LLM call.
+    Every decision is appended to TRIAGE_LOG_FILE.
+
+    Returns:
+        dict: State updates with the matching rule (or None)
+    """
+    email = state['current_email']
+    triage_rules = get_triage_rules()
+    reason = triage_email(email, triage_rules)
+
+    if triage_rules.get('enabled', True):
+        log_triage_decision(TRIAGE_LOG_FILE, email, reason)
+
+    if reason is None:
+        return {'triage_reason': None}
+
+    return {
+        'triage_reason': reason,
+        'messages': [f"Pre-triaged ({reason}): {email['subject']}"]
+    }
 
 
 def analyze_email_node(state: EmailAgentState) -> dict:
@@ -77,12 +257,27 @@ def analyze_email_node(state: EmailAgentState) -> dict:
     # 1. Get current_email from state
     email = state['current_email']
 
+    # Already analyzed by prepare_llm_node
+    precomputed = (state.get('llm_results') or {}).get(email['id'])
+    if precomputed is not None:
+        analysis = precomputed['analysis']
+        return {
+            'analysis': analysis,
+            'draft_response': precomputed['draft'],
+            'messages': [f"Analyzed: {analysis['category']}"]
+        }
+
     # 2. Call analyze_email() from llm_tools
-    analysis = analyze_email(email)
+    # (fused mode also writes the reply in the same call)
+    if FUSED_LLM:
+        analysis = analyze_and_respond(email, cache=get_llm_cache())
+    else:
+        analysis = analyze_email(email, cache=get_llm_cache())
 
     # 3. Return analysis
     return {
        'analysis': analysis,
+       'draft_response': analysis.get('draft', ''),
         'messages':  [f"Analyzed: {analysis['category']}"]
         }
 
@@ -99,7 +294,7 @@ def generate_response_node(state: EmailAgentState) -> dict:
     analysis = state['analysis']
 
     # 2. Call generate_response()
-    draft = generate_response(email, analysis)
+    draft = generate_response(email, analysis, cache=get_llm_cache())
 
     # 3. Return draft
     return {
@@ -118,24 +313,21 @@ def create_draft_node(state: EmailAgentState) -> dict:
     # 1. Get current_email, draft_response from state
     email = state['current_email']
     draft_response = state['draft_response']
-    service = get_gmail_service()
 
-    # 2. Call create_draft() from gmail_tools
-    draft = create_draft(
-        service=service,
+    # 2. Queue the draft; the writer creates drafts in batches and marks
+    # the email as read once its draft exists
+    state['draft_writer'].submit(
         to = email['sender'], 
         subject= f"Re: {email['subject']}",
         body= draft_response,
-        thread_id= email['thread_id'])
-    
-    # Mark email as read since we processed it
-    mark_as_read(service, email['id'])
+        thread_id= email['thread_id'],
+        context= email)
 
     # 3. Increment current_index for next email
     # 4. Return updates
     return {
     "current_index": state['current_index'] + 1,
-    "messages": [f"Draft created for: {email['subject']}"]
+    "messages": [f"Draft queued for: {email['subject']}"]
     }
 
 
@@ -147,10 +339,23 @@ def should_continue(state: EmailAgentState) -> str:
     return "continue"
 
 
+def should_analyze(state: EmailAgentState) -> str:
+    """Decide if the current email needs the LLM or was pre-triaged."""
+    if state.get('triage_reason'):
+        return "skip"
+    return "analyze"
+
+
 def should_respond(state: EmailAgentState) -> str:
     """Decide if we should respond to this email."""
     analysis = state.get('analysis', {})
+    # The LLM call failed; leave the email for the next run
+    if analysis.get('category') == 'error':
+        return "failed"
     if analysis.get('should_respond', False):
+        # Fused mode already wrote the reply
+        if state.get('draft_response'):
+            return "drafted"
         return "respond"
     else:
         # Skip this email, move to next
@@ -162,13 +367,20 @@ def skip_email_node(state: EmailAgentState) -> dict:
     
     email = state['current_email']
     # Mark as read so we don't process it again
-    mark_as_read(get_gmail_service(), email['id'])
+    mark_email_as_read(get_gmail_service(), email, buffer=state.get('label_buffer'))
 
     return {
         "current_index": state['current_index'] + 1,
         "messages": [f"Skipped: {state['current_email']['subject']}"]
     }
 
+def failed_email_node(state: EmailAgentState) -> dict:
+    """Move to the next email, leaving the current one unread to retry later."""
+    return {
+        "current_index": state['current_index'] + 1,
+        "messages": [f"Analysis failed, left unread: {state['current_email']['subject']}"]
+    }
+
 def create_email_agent():
     """
     Build and compile the LangGraph email agent.
@@ -181,45 +393,64 @@ def create_email_agent():
     
     # Add all nodes
     workflow.add_node("fetch_emails", fetch_email_node)
+    workflow.add_node("prepare_llm", prepare_llm_node)
     workflow.add_node("select_email", select_email_node)
+    workflow.add_node("triage_email", triage_email_node)
     workflow.add_node("analyze_email", analyze_email_node)
     workflow.add_node("generate_response", generate_response_node)
     workflow.add_node("create_draft", create_draft_node)
     workflow.add_node("skip_email", skip_email_node)  # Add the skip node
+    workflow.add_node("failed_email", failed_email_node)
     
     # 1. Start → fetch
     workflow.add_edge(START, "fetch_emails")
     
-    # 2. fetch → select
-    workflow.add_edge("fetch_emails", "select_email")
+    # 2. fetch → run LLM steps concurrently (if enabled) → select
+    workflow.add_edge("fetch_emails", "prepare_llm")
+    workflow.add_edge("prepare_llm", "select_email")
     
     # 3. select → check if we have an email
     workflow.add_conditional_edges(
         "select_email",
         should_continue,
         {
-            "continue": "analyze_email",  
+            "continue": "triage_email",  
             "end": END                     
         }
     )
     
-    # 4. analyze → check if should respond
+    # 4. triage → skip obvious non-replies without calling the LLM
+    workflow.add_conditional_edges(
+        "triage_email",
+        should_analyze,
+        {
+            "analyze": "analyze_email",
+            "skip": "skip_email"
+        }
+    )
+    
+    # 5. analyze → check if should respond
     workflow.add_conditional_edges(
         "analyze_email",
         should_respond,
         {
             "respond": "generate_response",  
-            "skip": "skip_email"             
+            "drafted": "create_draft",
+            "skip": "skip_email",
+            "failed": "failed_email"
         }
     )
     
-    # 5. generate → create draft
+    # 6. generate → create draft
     workflow.add_edge("generate_response", "create_draft")
     
-    # 6. create draft → select next email (loop back)
+    # 7. create draft → select next email (loop back)
     workflow.add_edge("create_draft", "select_email")
     
-    # 7. skip → select next email (loop back)
+    # 8. skip → select next email (loop back)
     workflow.add_edge("skip_email", "select_email")
     
+    # 9. failed → select next email, the failed one stays unread
+    workflow.add_edge("failed_email", "select_email")
+    
     return workflow.compile()
@@ -0,0 +1,31 @@
+"""
+Body extraction cost with and without the byte budgets, on large nested
+multipart fixtures (no API calls):
+
+    python -m benchmarks.email_body [repeats]
+"""
+import sys
+import timeit
+
+from benchmarks.gmail_fixtures import nested_multipart, newsletter, text_part
+from tools.gmail_tools import get_email_body
+
+
+def main(repeats=20):
+    fixtures = {
+        'plain 5 MB, 10 levels': nested_multipart(depth=10, body_bytes=5 * 1024 * 1024, attachments=3),
+        'plain 200 KB, 50 levels': nested_multipart(depth=50, body_bytes=200 * 1024, attachments=2),
+        'newsletter 2 MB': text_part('text/html', newsletter(style_bytes=40 * 1024, paragraphs=40000)),
+    }
+    unlimited = {'max_bytes': sys.maxsize, 'max_html_bytes': sys.maxsize}
+
+    print(f"{'fixture':<26}{'budgeted':>12}{'unlimited':>12}{'chars':>9}")
+    for name, payload in fixtures.items():
+        budgeted = timeit.timeit(lambda: get_email_body(payload), number=repeats) / repeats
+        full = timeit.timeit(lambda: get_email_body(payload, **unlimited), number=repeats) / repeats
+        chars = len(get_email_body(payload))
+        print(f"{name:<26}{budgeted * 1000:>10.2f}ms{full * 1000:>10.2f}ms{chars:>9}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
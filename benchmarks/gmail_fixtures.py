@@ -0,0 +1,45 @@
+"""Gmail API message payloads for the body extraction tests and benchmark."""
+import base64
+
+
+def encode(text, charset='utf-8'):
+    return base64.urlsafe_b64encode(text.encode(charset)).decode('ascii')
+
+
+def text_part(mime_type, text, charset='utf-8', **extra):
+    """A MIME part as the Gmail API returns it."""
+    return {
+        'mimeType': mime_type,
+        'headers': [{'name': 'Content-Type', 'value': f'{mime_type}; charset="{charset}"'}],
+        'body': {'data': encode(text, charset), 'size': len(text)},
+        **extra
+    }
+
+
+def newsletter(style_bytes=20000, paragraphs=200):
+    """HTML-only newsletter whose <style> block is larger than BODY_BYTE_BUDGET."""
+    style = '.c { color: #123456; }\n' * (style_bytes // 23)
+    body = ''.join(f'<tr><td><p>Story {i}: something happened.</p></td></tr>' for i in range(paragraphs))
+    return (f'<html><head><style>{style}</style></head>'
+            f'<body><img src="https://t.example.com/pixel.gif"><table>{body}</table></body></html>')
+
+
+def nested_multipart(depth, body_bytes, attachments):
+    """
+    A multipart/alternative body (HTML and plain text) wrapped in depth
+    levels of multipart/mixed, each adding CSV attachments of body_bytes.
+    """
+    payload = {
+        'mimeType': 'multipart/alternative',
+        'parts': [
+            text_part('text/html', '<p>' + 'Grüße, ' * (body_bytes // 9) + '</p>'),
+            text_part('text/plain', 'Grüße, ' * (body_bytes // 9)),
+        ]
+    }
+    for level in range(depth):
+        files = [
+            text_part('text/csv', 'a,b,c\n' * (body_bytes // 6), filename=f'data{level}_{i}.csv')
+            for i in range(attachments)
+        ]
+        payload = {'mimeType': 'multipart/mixed', 'parts': files + [payload]}
+    return payload
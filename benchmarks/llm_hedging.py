@@ -0,0 +1,74 @@
+"""
+Tail latency with and without hedging, against a simulated LLM (no API calls):
+
+    python -m benchmarks.llm_hedging [calls]
+"""
+import asyncio
+import random
+import sys
+import time
+
+from tools.llm_router import LLMRouter
+from tools.llm_scheduler import LLMScheduler
+from tools.llm_stats import llm_stats
+
+
+class FakeLLM:
+    """Stand-in LLM with injected latency: mostly fast, with a slow tail."""
+
+    def __init__(self, median=0.05, slow_share=0.05, slow_factor=20):
+        self.median = median
+        self.slow_share = slow_share
+        self.slow_factor = slow_factor
+
+    async def ainvoke(self, messages, **kwargs):
+        latency = random.lognormvariate(0, 0.25) * self.median
+        if random.random() < self.slow_share:
+            latency *= self.slow_factor
+        await asyncio.sleep(latency)
+        return type('Response', (), {'content': '{}'})()
+
+
+def measure(router, stage, calls, concurrency=8):
+    """Run calls through a router and return their end-to-end latencies."""
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one():
+            async with semaphore:
+                start = time.monotonic()
+                await router.ainvoke(stage, [])
+                latencies.append(time.monotonic() - start)
+
+        await asyncio.gather(*(one() for _ in range(calls)))
+        return sorted(latencies)
+
+    return asyncio.run(run())
+
+
+def main(calls=400):
+    fake = FakeLLM()
+    routes = {'demo': {'model': 'fake', 'temperature': 0.0, 'max_tokens': 0}}
+
+    for label, percentile in (('without hedging', None), ('hedged at p95', 95)):
+        router = LLMRouter(routes=routes, fallback_model=None, hedge_percentile=percentile)
+        router.scheduler = LLMScheduler(rpm=0, tpm=0)
+        router._attempts = lambda stage, emails=1: [(fake, 'fake', 0)]
+
+        # Warm up the latency history the hedge delay is based on
+        measure(router, 'demo', 50)
+        latencies = measure(router, 'demo', calls)
+
+        def percentile_of(p):
+            return latencies[max(0, -(-p * len(latencies) // 100) - 1)] * 1000
+
+        print(f"{label:>16}: p50 {percentile_of(50):6.1f}ms  p95 {percentile_of(95):6.1f}ms  "
+              f"p99 {percentile_of(99):6.1f}ms")
+
+    hedges = llm_stats()['demo']
+    print(f"{hedges['hedges']} hedged requests, {hedges['hedge_wins']} won by the duplicate")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 400)
@@ -7,9 +7,80 @@ load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 MODEL_NAME = os.getenv("MODEL_NAME")
 
+# Gmail fetching
+# Gmail accepts up to 100 calls per batch request, but recommends 50 or fewer
+GMAIL_BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+
+# Most bytes of an email body decoded (the LLM only sees the start anyway)
+BODY_BYTE_BUDGET = int(os.getenv("BODY_BYTE_BUDGET", "16384"))
+# Most characters of text kept when an email only has an HTML body
+BODY_TEXT_BUDGET = int(os.getenv("BODY_TEXT_BUDGET", "4000"))
+# Most bytes of an HTML body decoded; conversion usually stops much earlier,
+# once BODY_TEXT_BUDGET of text is found, but styles can come first
+HTML_BYTE_BUDGET = int(os.getenv("HTML_BYTE_BUDGET", "1048576"))
+
+# LLM
+# Model routing: a small, fast model is enough to classify emails, a larger
+# one can write the replies. Both default to MODEL_NAME.
+ANALYSIS_MODEL = os.getenv("ANALYSIS_MODEL") or MODEL_NAME
+ANALYSIS_TEMPERATURE = float(os.getenv("ANALYSIS_TEMPERATURE", "0.3"))
+ANALYSIS_MAX_TOKENS = int(os.getenv("ANALYSIS_MAX_TOKENS", "400"))
+DRAFT_MODEL = os.getenv("DRAFT_MODEL") or MODEL_NAME
+DRAFT_TEMPERATURE = float(os.getenv("DRAFT_TEMPERATURE", "0.3"))
+DRAFT_MAX_TOKENS = int(os.getenv("DRAFT_MAX_TOKENS", "1024"))
+# Used when the stage's model is rate limited or doesn't answer in time
+FALLBACK_MODEL = os.getenv("FALLBACK_MODEL")
+# Hard deadline in seconds for one LLM request (hedges included); past it the
+# fallback model is tried, or the email gets the error fallback
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+# Send a duplicate request when the first one is slower than this percentile
+# of recent calls, and use whichever answers first
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+# Groq per-minute limits of your plan/model (0 = no limit); requests are
+# spaced to stay under them
+LLM_RPM = int(os.getenv("LLM_RPM", "30"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+# Their emails go first when requests have to wait (comma-separated, wildcards allowed)
+VIP_SENDERS = [sender.strip() for sender in os.getenv("VIP_SENDERS", "").split(",") if sender.strip()]
+# Analyze and write the reply in one LLM call instead of two
+FUSED_LLM = os.getenv("FUSED_LLM", "false").lower() == "true"
+# How many emails the LLM works on at the same time (1 = one by one)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "1"))
+# Most tokens of the email body put in each prompt (beginning and end are kept)
+ANALYSIS_TOKEN_BUDGET = int(os.getenv("ANALYSIS_TOKEN_BUDGET", "1500"))
+RESPONSE_TOKEN_BUDGET = int(os.getenv("RESPONSE_TOKEN_BUDGET", "600"))
+# Emails analyzed in one LLM request (1 = one request per email), and the
+# most email body tokens packed into one such request
+BATCH_ANALYSIS_SIZE = int(os.getenv("BATCH_ANALYSIS_SIZE", "1"))
+BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET", "6000"))
+# Count tokens with tiktoken (if installed) instead of the fast estimate
+EXACT_TOKENIZER = os.getenv("EXACT_TOKENIZER", "false").lower() == "true"
+
+# Agent
+MAX_EMAILS_PER_RUN = int(os.getenv("MAX_EMAILS_PER_RUN", "5"))
+# Stream the whole unread backlog page by page instead of a fixed-size list
+STREAM_EMAILS = os.getenv("STREAM_EMAILS", "false").lower() == "true"
+# Only fetch mail that arrived since the last run (Gmail history API)
+INCREMENTAL_SYNC = os.getenv("INCREMENTAL_SYNC", "false").lower() == "true"
+# Fetch only headers up front and download bodies when the LLM needs them
+LAZY_BODY = os.getenv("LAZY_BODY", "false").lower() == "true"
+# Process one email per conversation instead of every unread message
+THREAD_MODE = os.getenv("THREAD_MODE", "false").lower() == "true"
+# Skip newsletters, no-reply and bulk mail from headers alone, without the LLM
+PRE_TRIAGE = os.getenv("PRE_TRIAGE", "true").lower() == "true"
+# Each email takes several graph steps, so long runs need a high limit
+AGENT_RECURSION_LIMIT = int(os.getenv("AGENT_RECURSION_LIMIT", "10000"))
+
 # File paths
 CREDENTIALS_FILE = "config/credentials.json"
 TOKEN_FILE = "config/token.json"
+SYNC_STATE_FILE = "config/sync_state.json"  # Last Gmail historyId seen by the CLI
+MESSAGE_STORE_DIR = "config/message_store"  # Downloaded messages, reused across runs
+MESSAGE_STORE_MAX_MB = int(os.getenv("MESSAGE_STORE_MAX_MB", "200"))
+LLM_CACHE_FILE = "config/llm_cache.sqlite"  # LLM results for emails already seen
+TRIAGE_RULES_FILE = "config/triage_rules.json"  # Optional overrides of the pre-triage rules
+TRIAGE_LOG_FILE = "config/triage_log.jsonl"  # Every pre-triage decision
 
 # Gmail scope
 GMAIL_SCOPES = ["https://mail.google.com/"]
\ No newline at end of file
@@ -1,4 +1,10 @@
-from agents.email_agent import create_email_agent
+from agents.email_agent import create_email_agent, get_llm_cache
+from config.settings import AGENT_RECURSION_LIMIT, PRE_TRIAGE, TRIAGE_LOG_FILE
+from tools.gmail_quota import quota_stats
+from tools.body_cleaner import strip_stats
+from tools.llm_scheduler import scheduler_stats
+from tools.llm_stats import llm_stats
+from tools.triage_rules import summarize_triage_log
 
 def main():
     """Run the email automation agent."""
@@ -11,8 +17,13 @@ def main():
     # Initial state
     initial_state = {
         "emails": [],
+        "email_stream": None,
         "current_index": 0,
+        "label_buffer": None,
+        "draft_writer": None,
+        "llm_results": None,
         "current_email": None,
+        "triage_reason": None,
         "analysis": None,
         "draft_response": "",
         "user_approved": False,
@@ -21,7 +32,10 @@ def main():
     
     # Run the agent
     try:
-        result = agent.invoke(initial_state)
+        result = agent.invoke(
+            initial_state,
+            {"recursion_limit": AGENT_RECURSION_LIMIT}
+        )
         
         # Print results
         print("\n" + "="*50)
@@ -32,6 +46,36 @@ def main():
             print(f"  ✓ {msg}")
         
         print(f"\n📧 Processed {result['current_index']} emails")
+
+        for account, stats in quota_stats().items():
+            print(f"📈 Gmail quota ({account}): {stats['units_used']} units in "
+                  f"{stats['calls']} calls, {stats['retries']} retries, "
+                  f"{stats['usage']:.0%} of the per-minute limit")
+
+        for stage, stats in llm_stats().items():
+            models = ', '.join(f"{model} x{count}" for model, count in stats['models'].items())
+            print(f"🔢 LLM {stage}: {stats['calls']} calls ({models}), "
+                  f"{stats['avg_prompt_tokens']:.0f} prompt tokens and "
+                  f"{stats['avg_latency']:.2f}s on average (p95 {stats['p95'] or 0:.2f}s), "
+                  f"{stats['hedges']} hedged, {stats['failovers']} failovers, {stats['errors']} errors")
+
+        for queue in scheduler_stats():
+            print(f"⏳ LLM rate limits: {queue['throttled']} of {queue['requests']} requests waited, "
+                  f"{queue['avg_wait']:.1f}s on average (longest {queue['max_wait']:.1f}s, "
+                  f"up to {queue['max_queue_depth']} queued)")
+
+        stripped = strip_stats()
+        print(f"✂️  Quoted text, signatures and disclaimers: {stripped['chars_removed']} "
+              f"characters removed ({stripped['removed_share']:.0%} of email bodies)")
+
+        cache = get_llm_cache().stats()
+        print(f"🧠 LLM cache: {cache['hits']} hits, {cache['misses']} misses "
+              f"({cache['hit_rate']:.0%} hit rate, {cache['entries']} entries stored)")
+
+        if PRE_TRIAGE:
+            triage = summarize_triage_log(TRIAGE_LOG_FILE)
+            print(f"🚦 Pre-triage (all runs): {triage['skipped']} of {triage['total']} emails "
+                  f"skipped without the LLM ({triage['saved_share']:.0%})")
         print("\n✅ Check your Gmail drafts folder!")
         
     except Exception as e:
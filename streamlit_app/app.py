@@ -1,4 +1,10 @@
 import streamlit as st
+import sys
+from pathlib import Path
+
+# Add parent directory to path (components use the shared utils package)
+sys.path.append(str(Path(__file__).parent.parent))
+
 from components.auth import AuthManager
 from components.gmail_setup import GmailAuthManager
 from components.user_config import UserConfig
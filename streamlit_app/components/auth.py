@@ -79,7 +79,20 @@ class AuthManager:
                 "settings": {
                     "max_emails": 10,
                     "categories": ["primary"],
-                    "auto_mark_read": True
+                    "auto_mark_read": True,
+                    "incremental_sync": False,
+                    "group_threads": False,
+                    "fused_llm": False,
+                    "llm_concurrency": 1,
+                    "batch_analysis_size": 1,
+                    "vip_senders": [],
+                    "pre_triage": True,
+                    "triage_skip_senders": [],
+                    "triage_allow_senders": [],
+                    "local_classifier": False,
+                    "classifier_confidence": 0.9,
+                    "speculative_drafts": False,
+                    "speculation_confidence": 0.9
                 }
             }
             
@@ -2,8 +2,8 @@ import streamlit as st
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from pathlib import Path
+from utils.gmail_auth import get_gmail_service, forget_gmail_service
 
 
 class GmailAuthManager:
@@ -96,6 +96,7 @@ class GmailAuthManager:
             
             # Save token
             self._save_token(creds)
+            forget_gmail_service(self.token_file)
             
             # Clean up session
             st.session_state.pop(f'gmail_flow_{self.username}', None)
@@ -106,22 +107,15 @@ class GmailAuthManager:
             return False, f"OAuth failed: {str(e)}"
     
     def get_gmail_service(self):
-        """Get authenticated Gmail service."""
+        """Get authenticated Gmail service (cached per user)."""
         try:
             if not self.token_file.exists():
                 raise Exception("User is not authenticated with Gmail")
             
-            creds = Credentials.from_authorized_user_file(
-                str(self.token_file), self.scopes
+            return get_gmail_service(
+                self.token_file, scopes=self.scopes, interactive=False
             )
             
-            # Refresh if expired
-            if creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-                self._save_token(creds)
-            
-            return build("gmail", "v1", credentials=creds)
-            
         except Exception as e:
             st.error(f"Error getting Gmail service: {e}")
             raise
@@ -129,6 +123,7 @@ class GmailAuthManager:
     def revoke_access(self):
         """Revoke Gmail access."""
         try:
+            forget_gmail_service(self.token_file)
             if self.token_file.exists():
                 self.token_file.unlink()
                 return True
@@ -1,6 +1,7 @@
 import json
 from pathlib import Path
 import streamlit as st
+from tools.triage_rules import DEFAULT_TRIAGE_RULES
 
 
 class UserConfig:
@@ -11,6 +12,11 @@ class UserConfig:
         self.user_folder = Path(f"streamlit_app/data/users/{username}")
         self.config_file = self.user_folder / "config.json"
         self.history_file = self.user_folder / "history.json"
+        self.sync_state_file = self.user_folder / "sync_state.json"
+        self.message_store_dir = self.user_folder / "message_store"
+        self.llm_cache_file = self.user_folder / "llm_cache.sqlite"
+        self.triage_log_file = self.user_folder / "triage_log.jsonl"
+        self.reply_model_file = self.user_folder / "reply_model.json"
     
     def load_config(self):
         """Load user config."""
@@ -65,6 +71,16 @@ class UserConfig:
             st.error(f"Error updating settings: {e}")
             return False
     
+    def get_triage_rules(self):
+        """Pre-triage rules built from the user's settings."""
+        settings = self.get_settings()
+        return {
+            **DEFAULT_TRIAGE_RULES,
+            'enabled': settings.get('pre_triage', True),
+            'skip_senders': settings.get('triage_skip_senders', []),
+            'allow_senders': settings.get('triage_allow_senders', [])
+        }
+    
     def add_history(self, entry):
         """Add entry to history."""
         try:
@@ -100,6 +116,19 @@ class UserConfig:
             "settings": {
                 "max_emails": 10,
                 "categories": ["primary"],
-                "auto_mark_read": True
+                "auto_mark_read": True,
+                "incremental_sync": False,
+                "group_threads": False,
+                "fused_llm": False,
+                "llm_concurrency": 1,
+                "batch_analysis_size": 1,
+                "vip_senders": [],
+                "pre_triage": True,
+                "triage_skip_senders": [],
+                "triage_allow_senders": [],
+                "local_classifier": False,
+                "classifier_confidence": 0.9,
+                "speculative_drafts": False,
+                "speculation_confidence": 0.9
             }
         }
@@ -1,8 +1,8 @@
 import streamlit as st
 import sys
 from pathlib import Path
-import os
 from datetime import datetime
+from email.utils import parseaddr
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent.parent))
@@ -10,8 +10,18 @@ sys.path.append(str(Path(__file__).parent.parent.parent))
 from streamlit_app.components.auth import AuthManager
 from streamlit_app.components.gmail_setup import GmailAuthManager
 from streamlit_app.components.user_config import UserConfig
-from tools.gmail_tools import fetch_unread_emails, create_draft, mark_as_read
-from tools.llm_tools import analyze_email, generate_response
+from utils.message_store import MessageStore
+from tools.gmail_tools import (
+    fetch_unread_emails, fetch_new_emails, fetch_unread_threads, mark_email_as_read
+)
+from tools.draft_writer import DraftWriter
+from tools.label_buffer import LabelBuffer
+from tools.gmail_quota import get_tracker, account_for
+from tools.llm_cache import LLMCache
+from tools.llm_router import LLMRouter
+from tools.llm_tools import process_emails_concurrently, speculation_stats
+from tools.triage_rules import triage_email, log_triage_decision
+from tools.reply_classifier import ReplyClassifier, predicted_skip, likely_reply, usual_tones
 
 st.set_page_config(page_title="Dashboard", page_icon="🏠", layout="wide")
 
@@ -67,24 +77,74 @@ with col2:
         st.session_state.process_clicked = True
 
 if st.session_state.get('process_clicked', False):
+    label_buffer = None
+    draft_writer = None
     try:
-        # Set API key
-        os.environ['GROQ_API_KEY'] = config.get_groq_key()
+        # LLM calls use this user's key (clients are shared across runs, not across users)
+        llm_client = LLMRouter(
+            api_key=config.get_groq_key(),
+            vip_senders=settings.get('vip_senders', [])
+        )
         
         # Get Gmail service
         service = gmail_auth.get_gmail_service()
+        store = MessageStore(config.message_store_dir)
+        llm_cache = LLMCache(config.llm_cache_file)
+        
+        # Mark-as-read changes are sent together at the end of the run
+        label_buffer = LabelBuffer(service)
+        
+        # Approved drafts are created in batches; each result is logged
+        def on_draft_result(result):
+            email = result['context']
+            if result['error'] is None:
+                mark_email_as_read(service, email, buffer=label_buffer)
+                
+                # Add to history
+                config.add_history({
+                    'timestamp': datetime.now().isoformat(),
+                    'action': 'draft_created',
+                    'email': email['subject'],
+                    'sender': email['sender'],
+                    'tone': email.get('tone')
+                })
+            else:
+                st.error(f"Error creating draft for {email['subject']}: {result['error']}")
+        
+        draft_writer = DraftWriter(service, on_result=on_draft_result)
         
         # Fetch emails
         with st.spinner(f"Fetching up to {max_emails} unread emails..."):
-            emails = fetch_unread_emails(
-                service,
-                max_results=max_emails,
-                query='is:unread category:primary'
-            )
+            if settings.get('group_threads', False):
+                emails = fetch_unread_threads(
+                    service,
+                    max_results=max_emails,
+                    query='is:unread category:primary',
+                    store=store
+                )
+            elif settings.get('incremental_sync', False):
+                emails = fetch_new_emails(
+                    service,
+                    config.sync_state_file,
+                    query='is:unread category:primary',
+                    max_results=max_emails,
+                    store=store
+                )
+            else:
+                emails = fetch_unread_emails(
+                    service,
+                    max_results=max_emails,
+                    query='is:unread category:primary',
+                    store=store
+                )
         
         if not emails:
             st.info("📭 No unread emails found in primary inbox")
             st.session_state.process_clicked = False
+            
+            # st.stop() ends the script without reaching the close() calls below
+            draft_writer.close()
+            label_buffer.close()
             st.stop()
         
         st.success(f"✅ Found {len(emails)} unread emails")
@@ -96,10 +156,83 @@ if st.session_state.get('process_clicked', False):
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        for idx, email in enumerate(emails):
-            progress = (idx + 1) / len(emails)
+        # Newsletters, no-reply and bulk mail are skipped without an AI call,
+        # and so are emails the local model is confident won't get a reply
+        triage_rules = config.get_triage_rules()
+        reply_model = ReplyClassifier.load(config.reply_model_file)
+        use_classifier = settings.get('local_classifier', False)
+        to_analyze = []
+        
+        for email in emails:
+            reason = triage_email(email, triage_rules)
+            history_reason = f"pre-triage: {reason}"
+            
+            if reason is None and use_classifier:
+                confidence = predicted_skip(email, reply_model, settings.get('classifier_confidence', 0.9))
+                if confidence is not None:
+                    reason = 'classifier'
+                    history_reason = f"classifier: {confidence:.0%} confident"
+            
+            if triage_rules['enabled'] or use_classifier:
+                log_triage_decision(config.triage_log_file, email, reason)
+            
+            if reason is None:
+                to_analyze.append(email)
+                continue
+            
+            try:
+                mark_email_as_read(service, email, buffer=label_buffer)
+                
+                # Add to history
+                config.add_history({
+                    'timestamp': datetime.now().isoformat(),
+                    'action': 'auto_skipped',
+                    'email': email['subject'],
+                    'sender': email['sender'],
+                    'reason': history_reason
+                })
+                
+                skipped_count += 1
+            except Exception as e:
+                st.error(f"Error: {e}")
+        
+        if skipped_count:
+            st.info(f"🚦 {skipped_count} emails skipped without an AI call")
+        
+        status_text.text("Analyzing emails...")
+        
+        # Emails the local model is confident will get a reply have it
+        # written while they're analyzed, in the sender's usual tone
+        speculate = None
+        if settings.get('speculative_drafts', False):
+            tones = usual_tones(config.load_history())
+            threshold = settings.get('speculation_confidence', 0.9)
+            
+            def speculate(email):
+                if likely_reply(email, reply_model, threshold) is None:
+                    return None
+                return tones.get(parseaddr(email['sender'])[1].lower(), 'formal')
+        
+        speculation_before = speculation_stats()
+        
+        # Emails are analyzed concurrently and shown as each one finishes
+        llm_results = process_emails_concurrently(
+            to_analyze,
+            concurrency=settings.get('llm_concurrency', 1),
+            fused=settings.get('fused_llm', False),
+            cache=llm_cache,
+            batch_size=settings.get('batch_analysis_size', 1),
+            client=llm_client,
+            speculate=speculate
+        )
+        
+        for idx, result in enumerate(llm_results):
+            email = result['email']
+            analysis = result['analysis']
+            
+            progress = (idx + 1) / len(to_analyze)
             progress_bar.progress(progress)
-            status_text.text(f"Processing email {idx + 1}/{len(emails)}...")
+            status_text.text(f"Processed email {idx + 1}/{len(to_analyze)}...")
             
             with st.expander(f"📨 {email['subject'][:60]}..."):
                 col1, col2 = st.columns([2, 1])
@@ -113,19 +246,13 @@ if st.session_state.get('process_clicked', False):
                 
                 st.text_area("Email Preview:", email['body'][:300] + "...", height=100, disabled=True)
                 
-                # Analyze email
-                with st.spinner("Analyzing..."):
-                    analysis = analyze_email(email)
-                
                 col1, col2, col3 = st.columns(3)
                 col1.metric("Category", analysis['category'])
                 col2.metric("Urgency", analysis['urgency'])
                 col3.metric("Respond?", "Yes" if analysis['should_respond'] else "No")
                 
                 if analysis['should_respond']:
-                    # Generate response
-                    with st.spinner("Generating response..."):
-                        draft_text = generate_response(email, analysis)
+                    draft_text = result['draft']
                     
                     st.markdown("**Generated Draft:**")
                     st.text_area("", draft_text, height=200, disabled=True, key=f"draft_{email['id']}")
@@ -135,32 +262,21 @@ if st.session_state.get('process_clicked', False):
                     with col1:
                         if st.button("✅ Create Draft", key=f"approve_{email['id']}", width='stretch'):
                             try:
-                                create_draft(
-                                    service,
+                                draft_writer.submit(
                                     to=email['sender'],
                                     subject=f"Re: {email['subject']}",
                                     body=draft_text,
-                                    thread_id=email['thread_id']
+                                    thread_id=email['thread_id'],
+                                    context={**email, 'tone': analysis['tone']}
                                 )
-                                mark_as_read(service, email['id'])
-                                
-                                # Add to history
-                                config.add_history({
-                                    'timestamp': datetime.now().isoformat(),
-                                    'action': 'draft_created',
-                                    'email': email['subject'],
-                                    'sender': email['sender']
-                                })
-                                
-                                drafted_count += 1
-                                st.success("✅ Draft created!")
+                                st.success("✅ Draft queued!")
                             except Exception as e:
                                 st.error(f"Error creating draft: {e}")
                     
                     with col2:
                         if st.button("❌ Skip", key=f"skip_{email['id']}", width='stretch'):
                             try:
-                                mark_as_read(service, email['id'])
+                                mark_email_as_read(service, email, buffer=label_buffer)
                                 
                                 # Add to history
                                 config.add_history({
@@ -174,10 +290,14 @@ if st.session_state.get('process_clicked', False):
                                 st.info("⏭️ Email skipped")
                             except Exception as e:
                                 st.error(f"Error skipping: {e}")
+                elif analysis['category'] == 'error':
+                    # Left unread so the next run retries it; not recorded in
+                    # the history the local model learns from
+                    st.warning("⚠️ Analysis failed - left unread to retry later")
                 else:
                     st.info("⏭️ No response needed - marking as read")
                     try:
-                        mark_as_read(service, email['id'])
+                        mark_email_as_read(service, email, buffer=label_buffer)
                         
                         # Add to history
                         config.add_history({
@@ -191,6 +311,14 @@ if st.session_state.get('process_clicked', False):
                     except Exception as e:
                         st.error(f"Error: {e}")
         
+        draft_results = draft_writer.close()
+        drafted_count = sum(1 for result in draft_results if result['error'] is None)
+        
+        # Keep the local model up to date with this run's decisions
+        reply_model.learn_from_history(config.load_history())
+        reply_model.save(config.reply_model_file)
+        label_buffer.close()
+        
         # Update metrics
         st.session_state.metrics['processed'] = len(emails)
         st.session_state.metrics['drafted'] = drafted_count
@@ -202,12 +330,43 @@ if st.session_state.get('process_clicked', False):
         st.balloons()
         st.success(f"✅ Processed {len(emails)} emails! {drafted_count} drafts created, {skipped_count} skipped.")
         
+        quota = get_tracker(account_for(service)).stats()
+        st.caption(
+            f"Gmail quota: {quota['units_used']} units in {quota['calls']} calls, "
+            f"{quota['retries']} retries, {quota['usage']:.0%} of the per-minute limit"
+        )
+        
+        cache = llm_cache.stats()
+        st.caption(
+            f"LLM cache: {cache['hits']} hits, {cache['misses']} misses "
+            f"({cache['hit_rate']:.0%} hit rate)"
+        )
+        
+        queue = llm_client.scheduler.stats()
+        st.caption(
+            f"Groq rate limits: {queue['throttled']} of {queue['requests']} requests waited "
+            f"(longest {queue['max_wait']:.1f}s, up to {queue['max_queue_depth']} queued)"
+        )
+        
+        if speculate is not None:
+            speculation = speculation_stats()
+            hits = speculation['hits'] - speculation_before['hits']
+            started = speculation['started'] - speculation_before['started']
+            saved = speculation['saved_seconds'] - speculation_before['saved_seconds']
+            st.caption(f"Early replies: {hits} of {started} kept, {saved:.1f}s of waiting saved")
+        
         st.session_state.process_clicked = False
         
     except Exception as e:
         st.error(f"❌ Error processing emails: {str(e)}")
         st.exception(e)
         st.session_state.process_clicked = False
+        
+        # Don't lose drafts and label changes made before the error
+        if draft_writer is not None:
+            draft_writer.close()
+        if label_buffer is not None:
+            label_buffer.close()
 
 st.markdown("---")
 
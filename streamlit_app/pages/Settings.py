@@ -95,13 +95,112 @@ with st.form("settings_form"):
         help="Mark emails as read after processing"
     )
     
+    incremental_sync = st.checkbox(
+        "Only fetch new emails since the last run",
+        value=settings.get('incremental_sync', False),
+        help="Use Gmail's change history instead of searching the whole inbox every run"
+    )
+    
+    group_threads = st.checkbox(
+        "Reply once per conversation",
+        value=settings.get('group_threads', False),
+        help="Treat the latest unread message of a thread as one email, with earlier messages as context"
+    )
+    
+    fused_llm = st.checkbox(
+        "Analyze and draft in a single AI call",
+        value=settings.get('fused_llm', False),
+        help="Faster and cheaper: the reply is written in the same request as the analysis"
+    )
+    
+    llm_concurrency = st.slider(
+        "Emails analyzed at the same time:",
+        min_value=1,
+        max_value=10,
+        value=settings.get('llm_concurrency', 1),
+        help="Higher is faster, but uses your Groq rate limit more quickly"
+    )
+    
+    batch_analysis_size = st.slider(
+        "Emails analyzed per AI request:",
+        min_value=1,
+        max_value=10,
+        value=settings.get('batch_analysis_size', 1),
+        help="Short emails can share one request, which is faster and cheaper. Not used with single-call mode"
+    )
+    
+    vip_senders = st.text_area(
+        "VIP senders, analyzed first (one per line):",
+        value="\n".join(settings.get('vip_senders', [])),
+        help="When your Groq rate limit is reached, emails from these senders go first. Wildcards are allowed, e.g. *@client.com"
+    )
+    
+    pre_triage = st.checkbox(
+        "Skip newsletters, no-reply and bulk mail without AI",
+        value=settings.get('pre_triage', True),
+        help="Mailing lists, no-reply senders, bulk mail and calendar notifications are recognized from their headers and marked as read without an AI call"
+    )
+    
+    triage_skip_senders = st.text_area(
+        "Always skip these senders (one per line):",
+        value="\n".join(settings.get('triage_skip_senders', [])),
+        help="Wildcards are allowed, e.g. *@news.example.com"
+    )
+    
+    triage_allow_senders = st.text_area(
+        "Never auto-skip these senders (one per line):",
+        value="\n".join(settings.get('triage_allow_senders', [])),
+        help="These senders always go to the AI, even if they look like bulk mail"
+    )
+    
+    local_classifier = st.checkbox(
+        "Learn which emails I skip and skip them without AI",
+        value=settings.get('local_classifier', False),
+        help="A small model trained on your history skips emails it is confident you won't reply to"
+    )
+    
+    classifier_confidence = st.slider(
+        "Confidence needed to skip without AI:",
+        min_value=0.5,
+        max_value=0.99,
+        value=settings.get('classifier_confidence', 0.9),
+        help="Higher skips fewer emails but makes fewer mistakes"
+    )
+    
+    speculative_drafts = st.checkbox(
+        "Start replies early for emails I almost always answer",
+        value=settings.get('speculative_drafts', False),
+        help="The reply is written while the AI is still analyzing the email, in the tone you usually use with that sender. If the analysis disagrees, the early reply is thrown away. Faster, but uses more of your Groq rate limit"
+    )
+    
+    speculation_confidence = st.slider(
+        "Reply likelihood needed to start early:",
+        min_value=0.5,
+        max_value=0.99,
+        value=settings.get('speculation_confidence', 0.9),
+        help="Lower starts more replies early, but more of them are thrown away"
+    )
+    
     submit = st.form_submit_button("💾 Save Settings", width='stretch')
     
     if submit:
         updated_settings = {
             'max_emails': max_emails,
             'categories': categories,
-            'auto_mark_read': auto_mark_read
+            'auto_mark_read': auto_mark_read,
+            'incremental_sync': incremental_sync,
+            'group_threads': group_threads,
+            'fused_llm': fused_llm,
+            'llm_concurrency': llm_concurrency,
+            'batch_analysis_size': batch_analysis_size,
+            'vip_senders': [line.strip() for line in vip_senders.splitlines() if line.strip()],
+            'pre_triage': pre_triage,
+            'triage_skip_senders': [line.strip() for line in triage_skip_senders.splitlines() if line.strip()],
+            'triage_allow_senders': [line.strip() for line in triage_allow_senders.splitlines() if line.strip()],
+            'local_classifier': local_classifier,
+            'classifier_confidence': classifier_confidence,
+            'speculative_drafts': speculative_drafts,
+            'speculation_confidence': speculation_confidence
         }
         
         if config.update_settings(updated_settings):
@@ -0,0 +1,153 @@
+import time
+
+import pytest
+
+from tools.body_cleaner import strip_quoted_text
+
+# (name, body, expected text after cleaning)
+CORPUS = [
+    (
+        'gmail reply header',
+        "Sounds good, see you Monday.\n\n"
+        "On Mon, 3 Jun 2024 at 10:00, Sam <sam@example.com> wrote:\n"
+        "> Can we meet on Monday?\n> Sam",
+        "Sounds good, see you Monday."
+    ),
+    (
+        'wrapped reply header',
+        "Yes, approved.\n\n"
+        "On Mon, 3 Jun 2024 at 10:00, Samantha Longname-Example\n"
+        "<samantha@example.com> wrote:\n"
+        "> Please approve the budget.",
+        "Yes, approved."
+    ),
+    (
+        'outlook original message',
+        "Attached is the report.\n\n"
+        "-----Original Message-----\n"
+        "From: Sam\nSent: Monday\nSubject: Report\n\nCan you send the report?",
+        "Attached is the report."
+    ),
+    (
+        'outlook from block',
+        "Thanks!\n\n"
+        "From: Sam <sam@example.com>\nSent: Monday, June 3, 2024 10:00 AM\n"
+        "To: Me\nSubject: Report\n\nOld message",
+        "Thanks!"
+    ),
+    (
+        'inline quoted lines',
+        "> Can you make it at 3?\nYes, 3 works.\n> And bring the slides?\nWill do.",
+        "Yes, 3 works.\nWill do."
+    ),
+    (
+        'signature delimiter',
+        "See the notes below.\n\n-- \nJane Doe\nHead of Sales\n+1 555 0100",
+        "See the notes below."
+    ),
+    (
+        'mobile signature',
+        "On my way.\n\nSent from my iPhone",
+        "On my way."
+    ),
+    (
+        'mobile app signature',
+        "Will call you back.\n\nSent from my Samsung Galaxy smartphone.",
+        "Will call you back."
+    ),
+    (
+        'trailing disclaimer heading',
+        "Please find the contract attached.\n\nBest,\nJane\n"
+        "CONFIDENTIALITY NOTICE: This email and any attachments are for the "
+        "sole use of the intended recipient.",
+        "Please find the contract attached.\n\nBest,\nJane"
+    ),
+    (
+        'trailing disclaimer paragraph',
+        "Invoice attached.\n\n"
+        "This email is confidential and intended solely for the addressee.\n"
+        "If you received it by mistake, please delete it.\n\n"
+        "DISCLAIMER: Views expressed are the sender's own.",
+        "Invoice attached."
+    ),
+    (
+        'disclaimer before signature',
+        "Invoice attached.\n\n"
+        "This message is privileged and confidential.\n\n-- \nJane",
+        "Invoice attached."
+    ),
+]
+
+# Bodies that look like boilerplate in places but must be kept whole
+KEPT_WHOLE = [
+    (
+        'confidential sentence inside a paragraph',
+        "Hi,\nThis message is confidential until launch, please review the pricing below.\n"
+        "Price: $5"
+    ),
+    (
+        'confidential sentence followed by more text',
+        "Hi,\n\nThis message is confidential until launch.\n\n"
+        "Please review the pricing below.\nPrice: $5"
+    ),
+    (
+        'disclaimer heading followed by content',
+        "Disclaimer: I haven't tested this yet.\n\nSteps:\n1. Open the app\n2. Click export"
+    ),
+    (
+        'sentence starting with on',
+        "On Tuesday we ship the release.\nOn Wednesday we celebrate."
+    ),
+    (
+        'from line without outlook fields',
+        "From: the team lead's notes, the plan is:\n- ship\n- celebrate"
+    ),
+    (
+        'double dash in text',
+        "The range is 10--20 units.\nThanks"
+    ),
+    (
+        'sentence starting with sent from my',
+        "Hi Sam,\n\nSent from my office the numbers you asked for are below.\nQ1: 10\nQ2: 12"
+    ),
+]
+
+
+@pytest.mark.parametrize('name, body, expected', CORPUS, ids=[case[0] for case in CORPUS])
+def test_boilerplate_is_removed(name, body, expected):
+    text, removed = strip_quoted_text(body)
+
+    assert text == expected
+    assert removed == len(body) - len(expected)
+
+
+@pytest.mark.parametrize('name, body', KEPT_WHOLE, ids=[case[0] for case in KEPT_WHOLE])
+def test_real_text_is_kept(name, body):
+    text, removed = strip_quoted_text(body)
+
+    assert text == body
+    assert removed == 0
+
+
+def test_only_quoted_text_is_kept():
+    # Nothing of the sender's own, e.g. a bare forward
+    body = "> Forwarded from Sam:\n> Can you look at this?"
+
+    assert strip_quoted_text(body) == (body, 0)
+
+
+def test_empty_body():
+    assert strip_quoted_text(None) == ('', 0)
+    assert strip_quoted_text('') == ('', 0)
+
+
+def test_many_disclaimer_like_paragraphs_stay_linear():
+    # Every paragraph looks like a disclaimer, but real text comes last, so
+    # none of them is trailing; each must not rescan to the end
+    body = "\n\n".join(["This message is confidential, see below."] * 20000 + ["Real text"])
+
+    start = time.perf_counter()
+    text, removed = strip_quoted_text(body)
+
+    assert removed == 0
+    assert time.perf_counter() - start < 2
@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from benchmarks.gmail_fixtures import newsletter, text_part
+from tools.gmail_tools import get_email_body
+
+
+def test_html_body_after_large_style_block():
+    html = newsletter()
+    assert len(html) > 30000
+
+    body = get_email_body(text_part('text/html', html))
+
+    assert body.startswith('Story 0: something happened.')
+    assert '.c {' not in body
+
+
+def test_html_body_stops_at_text_budget():
+    body = get_email_body(text_part('text/html', newsletter(paragraphs=5000)))
+
+    assert 0 < len(body) <= 4000
+
+
+def test_nested_multipart_prefers_plain_text():
+    payload = {
+        'mimeType': 'multipart/mixed',
+        'parts': [
+            {
+                'mimeType': 'multipart/alternative',
+                'parts': [
+                    {
+                        'mimeType': 'multipart/related',
+                        'parts': [text_part('text/html', '<p>HTML version</p>')]
+                    },
+                    text_part('text/plain', 'Plain version'),
+                ]
+            },
+            text_part('text/plain', 'attached notes', filename='notes.txt'),
+        ]
+    }
+
+    assert get_email_body(payload) == 'Plain version'
+
+
+def test_plain_body_is_cut_at_byte_budget_without_splitting_characters():
+    # 'é' is two bytes in UTF-8, so the budget lands in the middle of one
+    body = get_email_body(text_part('text/plain', 'é' * 100), max_bytes=51)
+
+    assert body == 'é' * 25
+
+
+def test_declared_charset_is_used():
+    body = get_email_body(text_part('text/plain', 'Grüße aus Köln', charset='iso-8859-1'))
+
+    assert body == 'Grüße aus Köln'
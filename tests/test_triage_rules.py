@@ -0,0 +1,46 @@
+import pytest
+
+from tools.triage_rules import triage_email
+
+
+def email(sender, subject, **extra):
+    return {'id': '1', 'sender': sender, 'subject': subject, 'headers': {}, **extra}
+
+
+@pytest.mark.parametrize('sender, subject', [
+    ('Jane <jane@partner.com>', 'Invitation: speak at our March conference'),
+    ('HR <hr@acme.com>', 'Accepted: your offer letter'),
+    ('Sam <sam@example.com>', 'Declined: the budget, see my notes'),
+])
+def test_calendar_words_in_ordinary_mail_go_to_the_llm(sender, subject):
+    assert triage_email(email(sender, subject)) is None
+
+
+@pytest.mark.parametrize('sender, subject', [
+    ('Jane <jane@partner.com>',
+     'Invitation: Sync @ Mon Jun 3, 2024 10am - 11am (CEST) (me@example.com)'),
+    ('Sam <sam@example.com>',
+     'Accepted: Standup @ Weekly from 9am to 9:15am on weekdays (CEST) (me@example.com)'),
+    ('Sam <sam@example.com>',
+     'Updated invitation with note: Review @ Tue 4 Jun 2024 14:00 - 15:00 (BST) (me@example.com)'),
+])
+def test_google_calendar_subjects_are_skipped(sender, subject):
+    assert triage_email(email(sender, subject)) == 'calendar'
+
+
+def test_calendar_sender_is_skipped():
+    notification = email('Google Calendar <calendar-notification@google.com>', 'Reminder')
+
+    assert triage_email(notification) == 'calendar'
+
+
+def test_calendar_part_is_skipped():
+    invite = email('Jane <jane@partner.com>', 'Quarterly review', has_calendar=True)
+
+    assert triage_email(invite) == 'calendar'
+
+
+def test_calendar_rule_can_be_switched_off():
+    invite = email('Jane <jane@partner.com>', 'Quarterly review', has_calendar=True)
+
+    assert triage_email(invite, {'enabled': True, 'calendar': False}) is None
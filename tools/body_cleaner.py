@@ -0,0 +1,160 @@
+import re
+import threading
+
+# "On Mon, 3 Jun 2024 at 10:00, Sam <sam@example.com> wrote:" (may wrap onto a second line)
+REPLY_HEADER = re.compile(r'^\s*On\s.*$', re.IGNORECASE)
+WROTE_LINE = re.compile(r'\bwrote:\s*$', re.IGNORECASE)
+
+# Outlook and friends put a header block above the quoted message instead
+ORIGINAL_MESSAGE = re.compile(
+    r'^\s*(-{2,}\s*Original Message\s*-{2,}|_{10,}|From:\s.+)\s*$', re.IGNORECASE
+)
+OUTLOOK_HEADER_FIELDS = re.compile(r'^\s*(Sent|Date|To|Subject):\s', re.IGNORECASE)
+
+# "-- " is the standard signature delimiter; mobile clients add a short line
+# naming the device or app ("Sent from my iPhone")
+SIGNATURE_START = re.compile(
+    r'^(--\s*|__\s*'
+    r'|Sent from my (iPhone|iPad|Android|BlackBerry|Samsung|Galaxy|Pixel|mobile|phone|smartphone)'
+    r'\b[\w .,-]{0,30}'
+    r'|Get Outlook for (iOS|Android)'
+    r'|Sent from (Mail|Yahoo Mail|Outlook) for \w+[\w .-]{0,20})$',
+    re.IGNORECASE
+)
+
+# A legal disclaimer is either headed as one, or a sentence like "This email
+# is confidential..." starting a paragraph; both only count at the end of the
+# email (see _is_trailing_disclaimer), since the same words occur in real text
+DISCLAIMER_HEADING = re.compile(r'^\s*(\**\s*disclaimer\b|confidentiality notice\b)', re.IGNORECASE)
+DISCLAIMER_SENTENCE = re.compile(
+    r'^\s*this (e-?mail|message)\b.*\b(confidential|privileged|intended (solely |only )?for)\b',
+    re.IGNORECASE
+)
+
+_lock = threading.Lock()
+_stats = {'emails': 0, 'chars_in': 0, 'chars_removed': 0}
+
+
+def strip_quoted_text(body):
+    """
+    Remove quoted replies, signatures and disclaimers from an email body.
+
+    Lines starting with '>' are dropped. Everything from an "On ... wrote:"
+    or "-----Original Message-----" header or a signature delimiter onwards
+    is cut, since below those lines there is only history and boilerplate.
+    A legal disclaimer is cut too, if nothing but boilerplate follows it.
+    Each line is looked at once (and at most once more when looking ahead
+    from a disclaimer), so this runs in linear time.
+
+    Args:
+        body: Plain-text email body
+
+    Returns:
+        tuple: (cleaned text, number of characters removed)
+    """
+    body = body or ''
+    lines = body.split('\n')
+    kept = []
+
+    # No disclaimer before this line can be trailing: real text follows
+    content_at = 0
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+
+        if stripped.startswith('>'):
+            continue
+
+        if _is_reply_header(lines, i) or SIGNATURE_START.match(stripped):
+            break
+
+        if i >= content_at and _is_disclaimer_start(lines, i):
+            content_at = _next_content_paragraph(lines, i)
+            if content_at is None:
+                break
+
+        kept.append(line)
+
+    text = '\n'.join(kept).strip()
+
+    # Nothing of the sender's own left (e.g. a bare forward): keep it all
+    if not text:
+        text = body.strip()
+
+    removed = len(body) - len(text)
+    _record(len(body), removed)
+    return text, removed
+
+
+def _is_reply_header(lines, i):
+    line = lines[i]
+
+    if REPLY_HEADER.match(line):
+        if WROTE_LINE.search(line):
+            return True
+        # Long reply headers are often wrapped onto the next line
+        return i + 1 < len(lines) and WROTE_LINE.search(lines[i + 1]) is not None
+
+    if ORIGINAL_MESSAGE.match(line):
+        if not line.strip().lower().startswith('from:'):
+            return True
+        # A bare "From:" line only counts when followed by Sent/To/Subject
+        return i + 1 < len(lines) and OUTLOOK_HEADER_FIELDS.match(lines[i + 1]) is not None
+
+    return False
+
+
+def _is_disclaimer_start(lines, i):
+    stripped = lines[i].strip()
+    if DISCLAIMER_HEADING.match(stripped):
+        return True
+    # A sentence only counts when it starts a paragraph
+    return DISCLAIMER_SENTENCE.match(stripped) is not None and (i == 0 or not lines[i - 1].strip())
+
+
+def _next_content_paragraph(lines, i):
+    """
+    Find the first paragraph after line i's that isn't boilerplate.
+
+    Boilerplate paragraphs are further disclaimers; a signature, reply
+    header or quoted text ends the search, since everything after it is cut.
+
+    Returns:
+        int: Index of the paragraph's first line, or None if only boilerplate follows
+    """
+    paragraph_start = False
+    for j in range(i + 1, len(lines)):
+        stripped = lines[j].strip()
+        if not stripped:
+            paragraph_start = True
+            continue
+        if not paragraph_start:
+            continue
+
+        if SIGNATURE_START.match(stripped) or stripped.startswith('>') or _is_reply_header(lines, j):
+            return None
+        if not _is_disclaimer_start(lines, j):
+            return j
+        paragraph_start = False
+
+    return None
+
+
+def _record(chars_in, chars_removed):
+    with _lock:
+        _stats['emails'] += 1
+        _stats['chars_in'] += chars_in
+        _stats['chars_removed'] += chars_removed
+
+
+def strip_stats():
+    """
+    Characters removed by strip_quoted_text() in this process.
+
+    Returns:
+        dict: emails, chars_in, chars_removed and removed_share
+    """
+    with _lock:
+        stats = dict(_stats)
+    stats['removed_share'] = stats['chars_removed'] / stats['chars_in'] if stats['chars_in'] else 0.0
+    return stats
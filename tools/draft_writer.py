@@ -0,0 +1,105 @@
+import queue
+from config.settings import GMAIL_BATCH_SIZE
+from tools.gmail_tools import build_draft_body, execute_batch
+
+
+class DraftWriter:
+    """
+    Creates Gmail drafts in batches instead of one call at a time.
+
+    Finished replies are put on a queue with submit(). Once batch_size
+    replies are waiting (or when flush()/close() is called) they are sent
+    as one batch HTTP request of drafts().create calls.
+
+    Every draft produces a result dict:
+        {'context': <whatever was passed to submit>,
+         'draft': <Gmail draft resource, or None>,
+         'error': <exception, or None>}
+    Results are passed to on_result as they come in and collected in
+    self.results for the caller.
+    """
+
+    def __init__(self, service, batch_size=GMAIL_BATCH_SIZE, on_result=None):
+        self.service = service
+        self.batch_size = batch_size
+        self.on_result = on_result
+
+        self._queue = queue.Queue()
+        self.results = []
+
+    def submit(self, to, subject, body, thread_id=None, context=None):
+        """
+        Queue a draft to be created.
+
+        Args:
+            to: Recipient
+            subject: Email subject
+            body: Email body
+            thread_id: Optional thread ID
+            context: Anything the caller needs back with the result (e.g. the email)
+        """
+        self._queue.put((build_draft_body(to, subject, body, thread_id), context))
+
+        if self._queue.qsize() >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Create every queued draft.
+
+        Returns:
+            list: Result dicts for the drafts sent in this flush
+        """
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        if not items:
+            return []
+
+        requests = {
+            str(i): self._create_request_factory(draft_body)
+            for i, (draft_body, _) in enumerate(items)
+        }
+
+        try:
+            responses, failures = execute_batch(
+                self.service, requests, 'drafts.create', batch_size=self.batch_size
+            )
+        except Exception as e:
+            # The whole batch failed, report it for every draft
+            responses, failures = {}, {request_id: e for request_id in requests}
+
+        results = []
+        for i, (_, context) in enumerate(items):
+            request_id = str(i)
+            result = {
+                'context': context,
+                'draft': responses.get(request_id),
+                'error': failures.get(request_id)
+            }
+            if result['draft'] is None and result['error'] is None:
+                result['error'] = Exception("No response from Gmail")
+
+            results.append(result)
+            if self.on_result:
+                self.on_result(result)
+
+        self.results.extend(results)
+        return results
+
+    def _create_request_factory(self, draft_body):
+        return lambda: self.service.users().drafts().create(userId='me', body=draft_body)
+
+    def close(self):
+        """
+        Create any remaining drafts.
+
+        Returns:
+            list: Results for every draft submitted to this writer
+        """
+        self.flush()
+        return self.results
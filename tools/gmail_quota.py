@@ -0,0 +1,201 @@
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from googleapiclient.errors import HttpError
+
+# Gmail API quota units charged per call
+# https://developers.google.com/gmail/api/reference/quota
+QUOTA_COSTS = {
+    'getProfile': 1,
+    'history.list': 2,
+    'messages.list': 5,
+    'messages.get': 5,
+    'messages.modify': 5,
+    'messages.batchModify': 50,
+    'messages.send': 100,
+    'drafts.create': 10,
+    'threads.list': 10,
+    'threads.get': 10,
+}
+
+# Per-user limit enforced by Gmail
+UNITS_PER_SECOND = 250
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+class QuotaTracker:
+    """
+    Token bucket that keeps one Gmail account under its quota.
+
+    Every call is charged its quota cost before it is sent; when the bucket
+    is empty the caller waits until enough units have refilled. Usage
+    counters are kept so callers can see how close the account is to its limit.
+    """
+
+    def __init__(self, units_per_second=UNITS_PER_SECOND):
+        self.units_per_second = units_per_second
+        self._tokens = float(units_per_second)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.units_used = 0
+        self.retries = 0
+        self.waited_seconds = 0.0
+        self._recent = deque()  # (timestamp, units) over the last minute
+
+    def acquire(self, units):
+        """Wait until the account can spend units, then charge them."""
+        # A single call bigger than the bucket only waits for a full bucket
+        needed = min(units, self.units_per_second)
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.units_per_second,
+                    self._tokens + (now - self._last_refill) * self.units_per_second
+                )
+                self._last_refill = now
+
+                if self._tokens >= needed:
+                    self._tokens -= units
+                    self.calls += 1
+                    self.units_used += units
+                    self._recent.append((now, units))
+                    return
+
+                wait = (needed - self._tokens) / self.units_per_second
+
+            self.waited_seconds += wait
+            time.sleep(wait)
+
+    def stats(self):
+        """
+        Usage counters for this account.
+
+        Returns:
+            dict: calls, units_used, retries, waited_seconds,
+                  units_last_minute and usage (share of the per-minute limit)
+        """
+        with self._lock:
+            cutoff = time.monotonic() - 60
+            while self._recent and self._recent[0][0] < cutoff:
+                self._recent.popleft()
+            units_last_minute = sum(units for _, units in self._recent)
+
+        return {
+            'calls': self.calls,
+            'units_used': self.units_used,
+            'retries': self.retries,
+            'waited_seconds': round(self.waited_seconds, 2),
+            'units_last_minute': units_last_minute,
+            'usage': units_last_minute / (self.units_per_second * 60)
+        }
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def get_tracker(account='default'):
+    """Get the shared QuotaTracker for an account."""
+    with _trackers_lock:
+        if account not in _trackers:
+            _trackers[account] = QuotaTracker()
+        return _trackers[account]
+
+
+def account_for(service):
+    """Account key a Gmail service was built for (set by the auth helpers)."""
+    return getattr(service, 'quota_account', 'default')
+
+
+def quota_stats():
+    """Usage counters for every account seen by this process."""
+    with _trackers_lock:
+        trackers = dict(_trackers)
+    return {account: tracker.stats() for account, tracker in trackers.items()}
+
+
+def execute(service, request, method, units=None, max_retries=5, base_delay=1.0,
+            max_delay=60.0):
+    """
+    Execute a Gmail API request within the account's quota, retrying on rate limits.
+
+    Args:
+        service: Gmail service the request was built from
+        request: API request (or batch request) to execute
+        method: Key into QUOTA_COSTS, used to charge the call
+        units: Quota units to charge instead of the method's cost (for batches)
+        max_retries: Retries before the error is raised
+        base_delay: First backoff delay in seconds
+        max_delay: Longest backoff delay in seconds
+
+    Returns:
+        The API response
+    """
+    tracker = get_tracker(account_for(service))
+    if units is None:
+        units = QUOTA_COSTS.get(method, 5)
+
+    attempt = 0
+    while True:
+        tracker.acquire(units)
+        try:
+            return request.execute()
+        except HttpError as e:
+            if attempt >= max_retries or not is_rate_limited(e):
+                raise
+
+            delay = backoff_delay(e, attempt, base_delay, max_delay)
+            attempt += 1
+            tracker.retries += 1
+            print(f"Gmail {method} rate limited ({e.resp.status}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def is_rate_limited(error):
+    """Check if a Gmail API error means 'slow down and try again'."""
+    status = error.resp.status
+    if status in RETRY_STATUSES:
+        return True
+    if status == 403:
+        content = error.content.decode('utf-8', 'replace') if error.content else ''
+        return any(reason in content for reason in RATE_LIMIT_REASONS)
+    return False
+
+
+def backoff_delay(error, attempt, base_delay=1.0, max_delay=60.0):
+    """
+    Seconds to wait before retrying after a rate-limit error.
+
+    Retry-After is used when the server gives it, otherwise exponential
+    backoff with full jitter.
+    """
+    delay = retry_after(error)
+    if delay is None:
+        delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    return delay
+
+
+def retry_after(error):
+    """Seconds to wait from the Retry-After header, or None if not given."""
+    value = error.resp.get('retry-after')
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    # Retry-After may also be an HTTP date
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -1,34 +1,683 @@
 import base64
+import codecs
+import json
+import re
+import os
+import time
+from collections import deque
+from itertools import islice
+from pathlib import Path
 from email.mime.text import MIMEText
+from googleapiclient.errors import HttpError
+from config.settings import GMAIL_BATCH_SIZE, BODY_BYTE_BUDGET, BODY_TEXT_BUDGET, HTML_BYTE_BUDGET
+from tools.html_text import html_to_text
+from tools.gmail_quota import (
+    execute, is_rate_limited, backoff_delay, get_tracker, account_for, QUOTA_COSTS
+)
 
-def fetch_unread_emails(service, max_results=10, query='is:unread category:primary'):
+# Largest page messages().list will return
+MAX_PAGE_SIZE = 500
+
+# Headers downloaded in the metadata-only phase and kept on every email
+# (the pre-triage rules read the list/bulk ones)
+METADATA_HEADERS = [
+    'From', 'To', 'Subject', 'List-Unsubscribe', 'List-Id', 'Precedence', 'Auto-Submitted'
+]
+HEADER_NAMES = {name.lower(): name for name in METADATA_HEADERS}
+
+# Partial response mask for the metadata-only phase
+METADATA_FIELDS = 'id,threadId,snippet,labelIds,payload/headers,payload/mimeType'
+
+# Parts that make an email a calendar invitation or RSVP (iMIP)
+CALENDAR_MIME_TYPES = {'text/calendar', 'application/ics'}
+
+CHARSET_PATTERN = re.compile(r'charset="?([^";\s]+)', re.IGNORECASE)
+
+
+def fetch_unread_emails(service, max_results=10, query='is:unread category:primary',
+                        batch_size=GMAIL_BATCH_SIZE, store=None, lazy_body=False):
     """
     Fetch unread emails from Gmail inbox.
     
     Args:
         service: Authenticated Gmail service object
         max_results: Maximum number of emails to fetch
+        query: Gmail search query
+        batch_size: Number of message gets grouped into one batch request
+        store: Optional MessageStore, checked before downloading a message
+        lazy_body: Download only headers now, bodies on first access
         
     Returns:
         list: List of email dictionaries with basic info
     """
-    response = service.users().messages().list(
+    emails = iter_unread_emails(
+        service,
+        query=query,
+        page_size=min(max_results, MAX_PAGE_SIZE),
+        max_in_flight=min(batch_size, max_results),
+        store=store,
+        lazy_body=lazy_body
+    )
+    result = list(islice(emails, max_results))
+
+    if not result:
+        print('There are no unread emails.')
+
+    return result
+
+
+def iter_unread_emails(service, query='is:unread category:primary',
+                       page_size=100, max_in_flight=GMAIL_BATCH_SIZE, store=None,
+                       lazy_body=False):
+    """
+    Stream every email matching the query, page by page.
+
+    This is a generator: emails are fetched in small batches and yielded
+    as soon as they are parsed, so processing can start on the first email
+    before later pages are listed. At most max_in_flight emails are held in
+    memory at a time, however large the backlog is.
+
+    Args:
+        service: Authenticated Gmail service object
+        query: Gmail search query
+        page_size: Number of message IDs per list page (max 500)
+        max_in_flight: Maximum number of emails fetched and held at once
+        store: Optional MessageStore, checked before downloading a message
+        lazy_body: Download only headers now, bodies on first access
+
+    Yields:
+        dict: Email details (same shape as get_email_details)
+    """
+    page_token = None
+    max_in_flight = max(1, max_in_flight)
+
+    while True:
+        response = execute(service, service.users().messages().list(
+            userId='me',
+            q=query,
+            maxResults=min(page_size, MAX_PAGE_SIZE),
+            pageToken=page_token
+        ), 'messages.list')
+
+        message_ids = [msg['id'] for msg in response.get('messages', [])]
+
+        for i in range(0, len(message_ids), max_in_flight):
+            emails, failures = fetch_emails_batch(
+                service, message_ids[i:i + max_in_flight], batch_size=max_in_flight,
+                store=store, metadata_only=lazy_body
+            )
+
+            for message_id, error in failures.items():
+                print(f"Error fetching email {message_id}: {error}")
+
+            yield from emails
+
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+
+def fetch_emails_batch(service, message_ids, batch_size=GMAIL_BATCH_SIZE, store=None,
+                       metadata_only=False):
+    """
+    Fetch many emails at once using Gmail batch HTTP requests.
+
+    Instead of one round trip per message, up to batch_size gets are sent
+    in a single HTTP request (see execute_batch).
+
+    Args:
+        service: Gmail service
+        message_ids: Email message IDs to fetch
+        batch_size: Maximum number of gets per batch request
+        store: Optional MessageStore; stored messages are not downloaded
+               again and new downloads are added to it
+        metadata_only: Download only METADATA_HEADERS and return LazyEmail
+                       records that fetch the body the first time it's read
+
+    Returns:
+        tuple: (emails, failures)
+            emails: List of email dicts (same shape as get_email_details),
+                    in the same order as message_ids
+            failures: Dict of message_id -> error for emails that could not be fetched
+    """
+    message_ids = list(message_ids)
+
+    fetched = {}
+    failures = {}
+
+    if store is not None:
+        for message_id in message_ids:
+            email = get_stored_email(store, message_id)
+            if email is not None:
+                fetched[message_id] = email
+
+    requests = {
+        message_id: _get_request_factory(service, message_id, metadata_only)
+        for message_id in message_ids if message_id not in fetched
+    }
+    responses, failures = execute_batch(service, requests, 'messages.get',
+                                        batch_size=batch_size)
+
+    for message_id, response in responses.items():
+        if metadata_only:
+            fetched[message_id] = LazyEmail(
+                parse_email_metadata(response),
+                loader=lambda message_id: get_email_details(service, message_id, store)
+            )
+            continue
+
+        try:
+            fetched[message_id] = parse_email(response)
+        except Exception as e:
+            failures[message_id] = e
+            continue
+
+        if store is not None:
+            store.put(message_id, response)
+
+    emails = [fetched[message_id] for message_id in message_ids if message_id in fetched]
+    return emails, failures
+
+
+def _get_request_factory(service, message_id, metadata_only):
+    """Build a function that creates the messages().get request for one email."""
+    if metadata_only:
+        return lambda: service.users().messages().get(
+            userId='me',
+            id=message_id,
+            format='metadata',
+            metadataHeaders=METADATA_HEADERS,
+            fields=METADATA_FIELDS
+        )
+    return lambda: service.users().messages().get(userId='me', id=message_id, format='full')
+
+
+def execute_batch(service, requests, method, batch_size=GMAIL_BATCH_SIZE, max_retries=5):
+    """
+    Run many Gmail API calls using batch HTTP requests.
+
+    Up to batch_size calls are sent in a single HTTP request. When the
+    server rejects part of a batch (rate limit or server error), the
+    rejected calls are split in half and retried as smaller batches, after
+    waiting for Retry-After or a jittered backoff like single calls.
+
+    Args:
+        service: Gmail service
+        requests: Dict of request_id -> function returning a new API request
+                  (a request can't be reused once it has been sent)
+        method: Gmail method being called (key into QUOTA_COSTS)
+        batch_size: Maximum number of calls per batch request
+        max_retries: Times a rejected call is retried before it counts as failed
+
+    Returns:
+        tuple: (responses, failures)
+            responses: Dict of request_id -> API response
+            failures: Dict of request_id -> error for calls that failed
+    """
+    batch_size = max(1, batch_size)
+    request_ids = list(requests)
+
+    responses = {}
+    failures = {}
+    pending = deque(
+        (request_ids[i:i + batch_size], 0) for i in range(0, len(request_ids), batch_size)
+    )
+
+    while pending:
+        chunk, attempt = pending.popleft()
+        rejected = _execute_one_batch(service, chunk, requests, method, responses, failures)
+
+        if not rejected:
+            continue
+
+        if attempt >= max_retries:
+            failures.update(rejected)
+            continue
+
+        # Back off before sending them again, as long as the server asks to
+        delay = max(backoff_delay(error, attempt) for error in rejected.values())
+        get_tracker(account_for(service)).retries += 1
+        print(f"Gmail {method} batch: {len(rejected)} calls rate limited, "
+              f"retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+        # Split the rejected calls in half and retry each half
+        rejected_ids = list(rejected)
+        middle = (len(rejected_ids) + 1) // 2
+        for half in (rejected_ids[middle:], rejected_ids[:middle]):
+            if half:
+                pending.appendleft((half, attempt + 1))
+
+    return responses, failures
+
+
+def _execute_one_batch(service, request_ids, requests, method, responses, failures):
+    """
+    Send one batch request.
+
+    Successful responses are added to responses, permanent errors to failures.
+
+    Returns:
+        dict: request_id -> error for calls worth retrying
+    """
+    rejected = {}
+
+    def callback(request_id, response, exception):
+        if exception is None:
+            responses[request_id] = response
+        elif _is_retryable(exception):
+            rejected[request_id] = exception
+        else:
+            failures[request_id] = exception
+
+    batch = service.new_batch_http_request(callback=callback)
+    for request_id in request_ids:
+        batch.add(requests[request_id](), request_id=request_id)
+
+    try:
+        # Each call in a batch is charged separately against the quota
+        execute(service, batch, method, units=QUOTA_COSTS[method] * len(request_ids))
+    except HttpError as e:
+        # The whole batch was rejected, retry everything that didn't come back
+        if not _is_retryable(e):
+            raise
+        for request_id in request_ids:
+            if request_id not in responses and request_id not in failures:
+                rejected[request_id] = e
+
+    return rejected
+
+
+def _is_retryable(error):
+    """Check if a Gmail API error is worth retrying."""
+    return isinstance(error, HttpError) and is_rate_limited(error)
+
+
+def fetch_new_emails(service, checkpoint_file, query='is:unread category:primary',
+                     max_results=10, batch_size=GMAIL_BATCH_SIZE, store=None,
+                     lazy_body=False):
+    """
+    Fetch only emails added since the last run (incremental sync).
+
+    The mailbox historyId reached by the previous call is stored in
+    checkpoint_file. If it exists, users.history.list is asked only for
+    messageAdded changes since then, so the cost of a poll grows with new
+    mail rather than with the size of the inbox. A full query is used on the
+    first run, when the checkpoint has expired, or when the query can't be
+    expressed as label filters.
+
+    Note that max_results only limits the full query; an incremental sync
+    returns every new message so none is skipped by the next checkpoint.
+    Returned messages and those that failed with a transient error are kept
+    pending in the checkpoint and fetched again on later runs, until history
+    shows them read, moved or deleted. A full query that didn't reach the
+    end of the backlog saves no checkpoint, so the next run queries again
+    until every matching email has been seen.
+
+    Args:
+        service: Authenticated Gmail service object
+        checkpoint_file: Path of the JSON file holding the last historyId
+        query: Gmail search query
+        max_results: Maximum number of emails for a full query
+        batch_size: Number of message gets grouped into one batch request
+        store: Optional MessageStore, checked before downloading a message
+        lazy_body: Download only headers now, bodies on first access
+
+    Returns:
+        list: List of email dictionaries with basic info
+    """
+    history_id = load_history_id(checkpoint_file)
+    label_ids = query_to_label_ids(query)
+
+    if history_id and label_ids is not None:
+        try:
+            added_ids, dropped_ids, latest_history_id = _list_added_messages(
+                service, history_id, label_ids
+            )
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            # Checkpoint is too old, Gmail no longer has history for it
+            print('Sync checkpoint expired, running a full query.')
+        else:
+            # Messages still pending from earlier runs come first, unless
+            # history shows they've been read, moved or deleted since
+            pending_ids = [
+                message_id for message_id in load_pending_ids(checkpoint_file)
+                if message_id not in dropped_ids
+            ]
+            message_ids = pending_ids + [
+                message_id for message_id in added_ids if message_id not in pending_ids
+            ]
+
+            emails, failures = fetch_emails_batch(service, message_ids, batch_size=batch_size,
+                                                  store=store, metadata_only=lazy_body)
+
+            save_history_id(checkpoint_file, latest_history_id,
+                            _still_pending(emails, failures))
+            return emails
+
+    # Read the historyId before querying so nothing arriving meanwhile is missed
+    profile = execute(service, service.users().getProfile(userId='me'), 'getProfile')
+    message_ids, drained = _list_message_ids(service, query, max_results)
+    emails, failures = fetch_emails_batch(service, message_ids, batch_size=batch_size,
+                                          store=store, metadata_only=lazy_body)
+
+    if not emails:
+        print('There are no unread emails.')
+
+    if drained:
+        save_history_id(checkpoint_file, profile['historyId'], _still_pending(emails, failures))
+    else:
+        print(f'More than {max_results} matching emails, the next run will query again.')
+
+    return emails
+
+
+def _list_message_ids(service, query, max_results):
+    """
+    List the IDs of up to max_results messages matching the query.
+
+    Returns:
+        tuple: (message_ids, drained); drained is False if more messages match
+    """
+    message_ids = []
+    page_token = None
+
+    while True:
+        response = execute(service, service.users().messages().list(
+            userId='me',
+            q=query,
+            maxResults=min(max_results - len(message_ids), MAX_PAGE_SIZE),
+            pageToken=page_token
+        ), 'messages.list')
+
+        message_ids.extend(msg['id'] for msg in response.get('messages', []))
+        page_token = response.get('nextPageToken')
+
+        if not page_token:
+            return message_ids, True
+        if len(message_ids) >= max_results:
+            return message_ids, False
+
+
+def _still_pending(emails, failures):
+    """
+    IDs to keep in the checkpoint: every email returned, and transient failures.
+
+    A returned email isn't done until it's read; its draft may fail or wait
+    for approval. It's returned again by later runs until history shows it
+    read, moved or deleted.
+    """
+    return [email['id'] for email in emails] + _retry_later(failures)
+
+
+def _retry_later(failures):
+    """
+    Print fetch failures and return the IDs worth fetching again next run.
+
+    Rate limits, server errors and network errors are transient; a deleted
+    message or one that can't be parsed is not retried.
+    """
+    pending_ids = []
+    for message_id, error in failures.items():
+        print(f"Error fetching email {message_id}: {error}")
+        if _is_retryable(error) or isinstance(error, OSError):
+            pending_ids.append(message_id)
+    return pending_ids
+
+
+def _list_added_messages(service, start_history_id, label_ids):
+    """
+    List IDs of messages added since start_history_id that carry all label_ids.
+
+    Label changes and deletions since then are followed too, so a message
+    that has been read, moved or deleted meanwhile is left out without
+    relying on the labels of a downloaded (or stored) copy. The same
+    changes to older messages are reported as dropped, so messages kept
+    pending from earlier runs can be let go once they're read.
+
+    Returns:
+        tuple: (message_ids, dropped_ids, latest_history_id)
+    """
+    wanted = set(label_ids)
+    added_ids = []
+    labels = {}  # Message ID -> its labels as of the latest history record
+    lost = {}  # Older message ID -> the wanted labels it no longer has
+    deleted_ids = set()
+    latest_history_id = start_history_id
+    page_token = None
+
+    while True:
+        response = execute(service, service.users().history().list(
+            userId='me',
+            startHistoryId=start_history_id,
+            historyTypes=['messageAdded', 'labelAdded', 'labelRemoved', 'messageDeleted'],
+            pageToken=page_token
+        ), 'history.list')
+
+        for record in response.get('history', []):
+            for added in record.get('messagesAdded', []):
+                message = added['message']
+                if message['id'] not in labels:
+                    added_ids.append(message['id'])
+                labels[message['id']] = set(message.get('labelIds', []))
+
+            for change in record.get('labelsAdded', []):
+                message_id = change['message']['id']
+                if message_id in labels:
+                    labels[message_id].update(change.get('labelIds', []))
+                elif message_id in lost:
+                    lost[message_id].difference_update(change.get('labelIds', []))
+
+            for change in record.get('labelsRemoved', []):
+                message_id = change['message']['id']
+                if message_id in labels:
+                    labels[message_id].difference_update(change.get('labelIds', []))
+                else:
+                    lost.setdefault(message_id, set()).update(
+                        wanted.intersection(change.get('labelIds', []))
+                    )
+
+            for deleted in record.get('messagesDeleted', []):
+                message_id = deleted['message']['id']
+                if message_id in labels:
+                    labels[message_id] = set()
+                else:
+                    deleted_ids.add(message_id)
+
+        latest_history_id = response.get('historyId', latest_history_id)
+
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+    message_ids = [
+        message_id for message_id in added_ids
+        if wanted.issubset(labels[message_id])
+    ]
+    dropped_ids = deleted_ids | {message_id for message_id, gone in lost.items() if gone}
+    return message_ids, dropped_ids, latest_history_id
+
+
+# Search terms that map directly onto Gmail label IDs
+QUERY_LABELS = {
+    'is:unread': 'UNREAD',
+    'in:inbox': 'INBOX',
+    'is:starred': 'STARRED',
+    'is:important': 'IMPORTANT',
+    'category:primary': 'CATEGORY_PERSONAL',
+    'category:social': 'CATEGORY_SOCIAL',
+    'category:promotions': 'CATEGORY_PROMOTIONS',
+    'category:updates': 'CATEGORY_UPDATES',
+    'category:forums': 'CATEGORY_FORUMS',
+}
+
+
+def query_to_label_ids(query):
+    """
+    Convert a simple Gmail query into the label IDs it filters on.
+
+    Returns:
+        list: Label IDs, or None if the query uses terms that aren't labels
+    """
+    label_ids = []
+    for term in query.lower().split():
+        if term not in QUERY_LABELS:
+            return None
+        label_ids.append(QUERY_LABELS[term])
+    return label_ids
+
+
+def load_history_id(checkpoint_file):
+    """Read the saved historyId, or None if there is no usable checkpoint."""
+    try:
+        with open(checkpoint_file, 'r') as f:
+            return json.load(f).get('history_id')
+    except (OSError, ValueError):
+        return None
+
+
+def load_pending_ids(checkpoint_file):
+    """Read the IDs of messages the last sync failed to fetch."""
+    try:
+        with open(checkpoint_file, 'r') as f:
+            return list(json.load(f).get('pending_ids', []))
+    except (OSError, ValueError):
+        return []
+
+
+def save_history_id(checkpoint_file, history_id, pending_ids=()):
+    """Save the historyId reached by the latest sync, and messages still to fetch."""
+    checkpoint_file = Path(checkpoint_file)
+    checkpoint_file.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temp file first so a crash never leaves a half-written checkpoint
+    tmp_file = checkpoint_file.with_suffix('.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump({'history_id': str(history_id), 'pending_ids': list(pending_ids)}, f)
+    os.replace(tmp_file, checkpoint_file)
+
+
+def fetch_unread_threads(service, max_results=10, query='is:unread category:primary',
+                         batch_size=GMAIL_BATCH_SIZE, store=None, context_messages=5):
+    """
+    Fetch unread conversations, one email per thread.
+
+    Each thread is downloaded with a single users.threads.get call. The
+    latest unread message is returned as the unit of work, with the earlier
+    messages attached as compact context, so a thread with several unread
+    replies gets one analysis and one draft instead of one per message.
+
+    Args:
+        service: Authenticated Gmail service object
+        max_results: Maximum number of threads to fetch
+        query: Gmail search query
+        batch_size: Number of thread gets grouped into one batch request
+        store: Optional MessageStore, updated with the latest messages
+        context_messages: How many earlier messages to keep as context
+
+    Returns:
+        list: Email dicts with two extra keys:
+            'thread_context': List of {'sender', 'snippet'} for earlier messages
+            'unread_ids': IDs of every unread message in the thread
+    """
+    response = execute(service, service.users().threads().list(
         userId='me',
-        q=query,  # Query for unread emails
-        maxResults=max_results
-    ).execute()
-    
-    messages = response.get('messages',[])
-    
-    if not messages:
+        q=query,
+        maxResults=min(max_results, MAX_PAGE_SIZE)
+    ), 'threads.list')
+
+    thread_ids = [thread['id'] for thread in response.get('threads', [])][:max_results]
+
+    if not thread_ids:
         print('There are no unread emails.')
         return []
-    
-    result = [get_email_details(service, msg['id']) for msg in messages]
+
+    requests = {
+        thread_id: _thread_request_factory(service, thread_id)
+        for thread_id in thread_ids
+    }
+    responses, failures = execute_batch(service, requests, 'threads.get', batch_size=batch_size)
+
+    for thread_id, error in failures.items():
+        print(f"Error fetching thread {thread_id}: {error}")
+
+    result = []
+    for thread_id in thread_ids:
+        if thread_id not in responses:
+            continue
+        email = parse_thread(responses[thread_id], store, context_messages)
+        if email is not None:
+            result.append(email)
 
     return result
 
 
+def _thread_request_factory(service, thread_id):
+    return lambda: service.users().threads().get(userId='me', id=thread_id, format='full')
+
+
+def parse_thread(thread, store=None, context_messages=5):
+    """
+    Turn a Gmail thread resource into the email dict for its latest unread message.
+
+    Returns:
+        dict: Email details plus 'thread_context' and 'unread_ids',
+              or None if nothing in the thread is unread
+    """
+    messages = thread.get('messages', [])
+    unread = [message for message in messages if 'UNREAD' in message.get('labelIds', [])]
+
+    if not unread:
+        return None
+
+    latest = unread[-1]
+    email = get_stored_or_parse(latest, store)
+
+    context = []
+    for message in messages[:messages.index(latest)][-context_messages:]:
+        details = {}
+        _parse_headers(details, message['payload'].get('headers', []))
+        context.append({
+            'sender': details.get('sender', ''),
+            'snippet': message.get('snippet', '')
+        })
+
+    email['thread_context'] = context
+    email['unread_ids'] = [message['id'] for message in unread]
+
+    return email
+
+
+def get_stored_or_parse(email_content, store=None):
+    """Parse a full message resource, adding it to the store if given."""
+    email = parse_email(email_content)
+    if store is not None and email_content['id'] not in store:
+        store.put(email_content['id'], email_content)
+
+    return email
+
+
+def get_stored_email(store, message_id):
+    """
+    Parse a message from the store, or return None if it isn't stored.
+
+    Parsing the stored payload (rather than keeping parsed emails) means
+    stored messages always get the current parser. Its labels are the ones
+    it had when downloaded, so they may be out of date.
+    """
+    payload = store.get_payload(message_id)
+    if payload is None:
+        return None
+
+    try:
+        return parse_email(payload)
+    except Exception as e:
+        print(f"Error parsing stored email {message_id}, downloading it again: {e}")
+        return None
+
+
 # Email structure, it can also have nested parts
 {
     'id': 'message_id',
@@ -45,31 +694,105 @@ def fetch_unread_emails(service, max_results=10, query='is:unread category:prima
 }
 
 #  function to get the details from the email
-def get_email_details(service, message_id):
+def get_email_details(service, message_id, store=None):
     """
     Get detailed content of a specific email.
     
     Args:
         service: Gmail service
         message_id: Email message ID
+        store: Optional MessageStore, checked before downloading
         
     Returns:
         dict: Email details including sender, subject, body, date
     """
+    if store is not None:
+        email = get_stored_email(store, message_id)
+        if email is not None:
+            return email
 
-    email_content = service.users().messages().get(
+    email_content = execute(service, service.users().messages().get(
         userId='me',
         id=message_id,
         format='full'  # Get full email content
-    ).execute()
+    ), 'messages.get')
     
+    result = parse_email(email_content)
+
+    if store is not None:
+        store.put(message_id, email_content)
+
+    return result
+
+
+def parse_email(email_content):
+    """
+    Turn a Gmail message resource (format='full') into an email dict.
+
+    Args:
+        email_content: Message resource returned by messages().get
+
+    Returns:
+        dict: Email details including sender, subject, body
+    """
     result = {}
 
-    result['id'] = message_id
+    result['id'] = email_content['id']
     result['thread_id'] = email_content.get('threadId', '')
     result['snippet'] = email_content.get('snippet', '')
+    result['labels'] = email_content.get('labelIds', [])
 
-    headers = email_content['payload']['headers']  
+    _parse_headers(result, email_content['payload']['headers'])
+    result['has_calendar'] = has_calendar_part(email_content['payload'])
+
+    # Use the robust body extraction helper
+    result['body'] = get_email_body(email_content['payload'])
+    
+    # Fallback to snippet if body is empty
+    if not result['body']:
+        result['body'] = result['snippet']
+
+    return result
+
+
+def parse_email_metadata(email_content):
+    """
+    Turn a metadata-only message resource into an email dict without a body.
+
+    Args:
+        email_content: Message resource fetched with format='metadata'
+
+    Returns:
+        dict: Email details including sender and subject, but no body
+    """
+    result = {}
+
+    result['id'] = email_content['id']
+    result['thread_id'] = email_content.get('threadId', '')
+    result['snippet'] = email_content.get('snippet', '')
+    result['labels'] = email_content.get('labelIds', [])
+
+    _parse_headers(result, email_content.get('payload', {}).get('headers', []))
+    # Only the top-level type is downloaded, parts come with the body
+    result['has_calendar'] = has_calendar_part(email_content.get('payload', {}))
+
+    return result
+
+
+def has_calendar_part(payload):
+    """Whether a message payload, or any part nested in it, is an iCalendar object."""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        if part.get('mimeType', '').lower() in CALENDAR_MIME_TYPES:
+            return True
+        stack.extend(part.get('parts', []))
+    return False
+
+
+def _parse_headers(result, headers):
+    """Copy the headers we use into an email dict."""
+    result['headers'] = {}
 
     for header in headers:
       if header['name'] == 'From':
@@ -78,73 +801,244 @@ def get_email_details(service, message_id):
         result['subject'] = header['value']
       if header['name'] == 'To':  
         result['to'] = header['value']
+      # Header names are case-insensitive ('List-ID' vs 'List-Id')
+      name = HEADER_NAMES.get(header['name'].lower())
+      if name:
+        result['headers'][name] = header['value']
 
-    # Use the robust body extraction helper
-    result['body'] = get_email_body(email_content['payload'])
-    
-    # Fallback to snippet if body is empty
-    if not result['body']:
-        result['body'] = result['snippet']
 
-    return result
+class LazyEmail(dict):
+    """
+    Email dict whose body is downloaded the first time it is read.
 
+    Works anywhere a normal email dict does: email['body'] and
+    email.get('body') both trigger the download, and every other field is
+    available straight away. If the download fails (e.g. the message was
+    deleted meanwhile), the snippet is used as the body.
+    """
 
-def get_email_body(payload):
+    def __init__(self, data, loader):
+        super().__init__(data)
+        self._loader = loader
+
+    @property
+    def body_loaded(self):
+        return dict.__contains__(self, 'body')
+
+    def load_body(self):
+        """Download the full email and fill in the body."""
+        if self.body_loaded or self._loader is None:
+            return
+        try:
+            self['body'] = self._loader(self['id'])['body']
+        except Exception as e:
+            print(f"Error fetching body of email {self['id']}, using its snippet: {e}")
+            self['body'] = self.get('snippet', '')
+        self._loader = None
+
+    def set_body(self, body):
+        """Fill in a body downloaded elsewhere (see load_bodies)."""
+        self['body'] = body
+        self._loader = None
+
+    def __missing__(self, key):
+        if key == 'body' and self._loader is not None:
+            self.load_body()
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key == 'body':
+            self.load_body()
+        return super().get(key, default)
+
+
+def load_bodies(service, emails, batch_size=GMAIL_BATCH_SIZE, store=None):
     """
-    Recursively extract email body from payload.
+    Download the bodies of lazily fetched emails together, in batch requests.
+
+    Use this before handing the emails to code that mustn't block on a
+    download per email, such as the LLM event loop. Emails that already
+    have a body are left alone; one that can't be fetched gets its snippet,
+    as in LazyEmail.load_body.
+
+    Args:
+        service: Gmail service
+        emails: Email dicts, LazyEmail or not
+        batch_size: Maximum number of gets per batch request
+        store: Optional MessageStore, checked before downloading
+    """
+    lazy = [email for email in emails if isinstance(email, LazyEmail) and not email.body_loaded]
+    if not lazy:
+        return
+
+    full, failures = fetch_emails_batch(service, [email['id'] for email in lazy],
+                                        batch_size=batch_size, store=store)
+    bodies = {email['id']: email['body'] for email in full}
+
+    for email in lazy:
+        if email['id'] in bodies:
+            email.set_body(bodies[email['id']])
+        else:
+            print(f"Error fetching body of email {email['id']}, using its snippet: "
+                  f"{failures.get(email['id'])}")
+            email.set_body(email.get('snippet', ''))
+
+
+def get_email_body(payload, max_bytes=BODY_BYTE_BUDGET, max_html_bytes=HTML_BYTE_BUDGET):
+    """
+    Extract email body from payload.
     Handles simple, multipart, and nested multipart emails.
+
+    Parts are walked with a stack instead of recursion. The first text/plain
+    part wins, with text/html as the fallback (converted to plain text).
+    Attachments and inline images are skipped without being decoded, only
+    the first max_bytes of the chosen part are decoded, and each part's
+    declared charset is used. HTML is decoded chunk by chunk while it's
+    converted, until BODY_TEXT_BUDGET of text is found (or max_html_bytes),
+    since a newsletter's styles alone can be larger than max_bytes.
+
+    Args:
+        payload: Message payload from the Gmail API
+        max_bytes: Maximum number of body bytes to decode
+        max_html_bytes: Maximum number of HTML bytes to decode
+
+    Returns:
+        str: Email body text ('' if none found)
     """
-    body = ''
-    
-    # Case 1: Body data directly in payload
-    if 'body' in payload and 'data' in payload['body']:
-        return base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
-    
-    # Case 2: Multipart email - recursively search parts
-    if 'parts' in payload:
-        for part in payload['parts']:
-            # Check mime type - prefer text/plain, fallback to text/html
-            mime_type = part.get('mimeType', '')
-            
-            if mime_type == 'text/plain':
-                if 'data' in part['body']:
-                    return base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-            
-            # Recursive case: part has nested parts
-            if 'parts' in part:
-                body = get_email_body(part)
-                if body:
-                    return body
-        
-        # If no text/plain found, try text/html
-        for part in payload['parts']:
-            if part.get('mimeType') == 'text/html':
-                if 'data' in part['body']:
-                    return base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-    
-    return body
+    html_part = None
+    stack = [payload]
+
+    while stack:
+        part = stack.pop()
+
+        if 'parts' in part:
+            # Push in reverse so parts are visited in their original order
+            stack.extend(reversed(part['parts']))
+            continue
+
+        if _is_attachment(part) or 'data' not in part.get('body', {}):
+            continue
+
+        mime_type = part.get('mimeType', '')
+
+        if mime_type == 'text/html':
+            if html_part is None:
+                html_part = part
+            continue
+
+        # A single-part email is used whatever its type
+        if mime_type == 'text/plain' or part is payload:
+            return _decode_part(part, max_bytes)
+
+    # If no text/plain found, try text/html
+    if html_part is not None:
+        return html_to_text(_iter_decoded(html_part, max_html_bytes), max_chars=BODY_TEXT_BUDGET)
+
+    return ''
+
+
+def _is_attachment(part):
+    """Check if a MIME part is an attachment or inline image."""
+    if part.get('filename') or 'attachmentId' in part.get('body', {}):
+        return True
+    if not part.get('mimeType', 'text/plain').startswith('text/'):
+        return True
+
+    for header in part.get('headers', []):
+        if header['name'].lower() == 'content-disposition':
+            return header['value'].lower().startswith('attachment')
+
+    return False
+
+
+def _part_charset(part):
+    """Read the charset declared in a part's Content-Type header."""
+    for header in part.get('headers', []):
+        if header['name'].lower() == 'content-type':
+            match = CHARSET_PATTERN.search(header['value'])
+            if match:
+                return match.group(1)
+    return 'utf-8'
+
+
+def _decode_part(part, max_bytes):
+    """Decode at most max_bytes of a part's body, using its charset."""
+    return ''.join(_iter_decoded(part, max_bytes, chunk_bytes=max_bytes))
+
+
+def _iter_decoded(part, max_bytes, chunk_bytes=BODY_BYTE_BUDGET):
+    """
+    Decode at most max_bytes of a part's body, chunk_bytes at a time.
+
+    Yields:
+        str: Decoded text, in order; stop iterating to skip the rest
+    """
+    data = part['body']['data']
+
+    # Every 4 base64 characters hold 3 bytes, so only decode the prefix we need
+    data = data[:(max_bytes + 2) // 3 * 4]
+    step = max(1, (chunk_bytes + 2) // 3) * 4
+
+    try:
+        decoder = codecs.getincrementaldecoder(_part_charset(part))(errors='replace')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
 
+    remaining = max_bytes
+    for i in range(0, len(data), step):
+        chunk = data[i:i + step]
+        chunk += '=' * (-len(chunk) % 4)
+        raw = base64.urlsafe_b64decode(chunk)[:remaining]
+        remaining -= len(raw)
 
-def mark_as_read(service, message_id):
+        # final=False keeps a character split across chunks for the next one,
+        # and drops one cut in half at the byte limit
+        yield decoder.decode(raw, final=False)
+
+
+def mark_as_read(service, message_id, buffer=None):
     """
     Mark an email as read.
     
     Args:
         service: Gmail service
         message_id: Email message ID
+        buffer: Optional LabelBuffer; the change is queued and applied
+                in bulk when the buffer is flushed
     """
+    if buffer is not None:
+        buffer.mark_read(message_id)
+        return True
+
     try:
-        service.users().messages().modify(
+        execute(service, service.users().messages().modify(
             userId='me',
             id=message_id,
             body={'removeLabelIds': ['UNREAD']}
-        ).execute()
+        ), 'messages.modify')
         return True
     except Exception as e:
         print(f"Error marking email as read: {e}")
         return False
     
 
+def mark_email_as_read(service, email, buffer=None):
+    """
+    Mark an email as read, along with every other unread message
+    in its thread when it was fetched with fetch_unread_threads().
+
+    Args:
+        service: Gmail service
+        email: Email dict
+        buffer: Optional LabelBuffer to queue the changes in
+    """
+    ok = True
+    for message_id in email.get('unread_ids', [email['id']]):
+        ok = mark_as_read(service, message_id, buffer=buffer) and ok
+    return ok
+    
+
 def send_email(service, to, subject, body, thread_id=None):
     """
     Send an email (or reply to a thread).
@@ -159,26 +1053,16 @@ def send_email(service, to, subject, body, thread_id=None):
     Returns:
         dict: Sent message info
     """
-    message = MIMEText(body)
-    message['to'] = to
-    message['subject'] = subject
-
-    # Convert the message object to bytes
-    raw_message = message.as_bytes()
-
-    # Encode to base64 URL-safe format
-    encoded_message = base64.urlsafe_b64encode(raw_message).decode('utf-8')
-
-    body_payload = {'raw': encoded_message}
+    body_payload = {'raw': encode_message(to, subject, body)}
 
     # If replying to a thread, add threadId
     if thread_id:
         body_payload['threadId'] = thread_id
 
-    sent_message = service.users().messages().send(
+    sent_message = execute(service, service.users().messages().send(
         userId='me',
         body=body_payload
-    ).execute()
+    ), 'messages.send')
 
     return sent_message
 
@@ -196,6 +1080,33 @@ def create_draft(service, to, subject, body, thread_id=None):
     Returns:
         dict: Draft info
     """
+    draft_body = build_draft_body(to, subject, body, thread_id)
+
+    draft = execute(service, service.users().drafts().create(
+        userId='me',
+        body=draft_body
+    ), 'drafts.create')
+    
+    return draft
+
+
+def build_draft_body(to, subject, body, thread_id=None):
+    """Build the request body for drafts().create."""
+    draft_body = {'message': {'raw': encode_message(to, subject, body)}}
+
+    if thread_id:
+        draft_body['message']['threadId'] = thread_id
+
+    return draft_body
+
+
+def encode_message(to, subject, body):
+    """
+    Build a plain text email and encode it for the Gmail API.
+
+    Returns:
+        str: Base64 URL-safe encoded RFC822 message
+    """
     message = MIMEText(body)
     message['to'] = to
     message['subject'] = subject
@@ -204,16 +1115,4 @@ def create_draft(service, to, subject, body, thread_id=None):
     raw_message = message.as_bytes()
 
     # Encode to base64 URL-safe format
-    encoded_message = base64.urlsafe_b64encode(raw_message).decode('utf-8')
-
-    draft_body = {'message': { 'raw': encoded_message}}
-
-    if thread_id:
-       draft_body['message']['thread_id'] = thread_id
-
-    draft = service.users().drafts().create(
-        userId='me',
-        body=draft_body
-    ).execute() 
-    
-    return draft
\ No newline at end of file
+    return base64.urlsafe_b64encode(raw_message).decode('utf-8')
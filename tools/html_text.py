@@ -0,0 +1,123 @@
+import re
+from html.parser import HTMLParser
+
+# Content that never reaches the reader
+SKIP_TAGS = {'script', 'style', 'head', 'title', 'noscript', 'template', 'svg', 'object'}
+
+# Tags that start a new line; layout tables are flattened to one line per cell
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'hr', 'li', 'ul', 'ol', 'blockquote', 'pre', 'section',
+    'article', 'header', 'footer', 'table', 'tr', 'td', 'th',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+}
+
+# Tags that never have a closing tag
+VOID_TAGS = {'img', 'br', 'hr', 'meta', 'link', 'input', 'source', 'wbr', 'area', 'base', 'col'}
+
+HIDDEN_STYLE = re.compile(r'display\s*:\s*none|visibility\s*:\s*hidden', re.IGNORECASE)
+SPACES = re.compile(r'[ \t\r\f\v\u00a0]+')
+BLANK_LINES = re.compile(r'\n\s*\n+')
+
+
+class _BudgetReached(Exception):
+    """Raised inside the parser once enough text has been collected."""
+
+
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of an HTML document, up to max_chars."""
+
+    def __init__(self, max_chars):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts = []
+        self.length = 0
+        self.skip_stack = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            # Images (tracking pixels included) carry no text
+            if tag in BLOCK_TAGS:
+                self._newline()
+            return
+
+        attrs = dict(attrs)
+        if self.skip_stack or tag in SKIP_TAGS or HIDDEN_STYLE.search(attrs.get('style') or ''):
+            self.skip_stack.append(tag)
+            return
+
+        if tag in BLOCK_TAGS:
+            self._newline()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS and not self.skip_stack:
+            self._newline()
+
+    def handle_endtag(self, tag):
+        if self.skip_stack:
+            # Close the skipped element (and anything left open inside it)
+            if tag in self.skip_stack:
+                while self.skip_stack.pop() != tag:
+                    pass
+            return
+
+        if tag in BLOCK_TAGS:
+            self._newline()
+
+    def handle_data(self, data):
+        if self.skip_stack:
+            return
+
+        text = SPACES.sub(' ', data.replace('\n', ' '))
+        if not text.strip():
+            if self.parts and not self.parts[-1].endswith((' ', '\n')):
+                self._append(' ')
+            return
+
+        self._append(text)
+
+    def _newline(self):
+        if self.parts and not self.parts[-1].endswith('\n'):
+            self._append('\n')
+
+    def _append(self, text):
+        self.parts.append(text)
+        self.length += len(text)
+        if self.length >= self.max_chars:
+            raise _BudgetReached()
+
+
+def html_to_text(html, max_chars=4000, chunk_size=8192):
+    """
+    Convert HTML email content to plain text for prompting.
+
+    Scripts, styles, hidden elements and images (tracking pixels) are
+    dropped, and layout tables are flattened to one line per cell. The HTML
+    is parsed in chunks and parsing stops as soon as max_chars of text has
+    been collected, so a huge newsletter costs no more than a short one.
+
+    Args:
+        html: HTML source, or an iterable of chunks of it (e.g. decoded
+              as they are needed)
+        max_chars: Maximum length of the returned text
+        chunk_size: Characters fed to the parser at a time (for a string)
+
+    Returns:
+        str: Visible text of the HTML
+    """
+    parser = _TextExtractor(max_chars)
+
+    if isinstance(html, str):
+        html = (html[i:i + chunk_size] for i in range(0, len(html), chunk_size))
+
+    try:
+        for chunk in html:
+            parser.feed(chunk)
+        parser.close()
+    except _BudgetReached:
+        pass
+
+    text = ''.join(parser.parts)
+    text = '\n'.join(line.strip() for line in text.split('\n'))
+    text = BLANK_LINES.sub('\n\n', text).strip()
+
+    return text[:max_chars]
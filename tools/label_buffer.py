@@ -0,0 +1,141 @@
+import atexit
+import threading
+from tools.gmail_quota import execute
+
+
+class LabelBuffer:
+    """
+    Collects label changes during a run and applies them in bulk.
+
+    Instead of one messages().modify call per email, changes are grouped by
+    the labels they add/remove and sent with users.messages.batchModify,
+    up to 1000 message IDs per call. The buffer is flushed when it fills up,
+    when flush_interval seconds have passed since the oldest pending change
+    (by a timer, so even if nothing else is queued), when close() is called
+    at the end of a run, and when the process exits.
+    """
+
+    # Most message IDs batchModify accepts in one call
+    MAX_IDS = 1000
+
+    def __init__(self, service, max_ids=MAX_IDS, flush_interval=30):
+        self.service = service
+        self.max_ids = min(max_ids, self.MAX_IDS)
+        self.flush_interval = flush_interval
+
+        # message_id -> (labels to add, labels to remove)
+        self._pending = {}
+        self._timer = None  # Flushes flush_interval after the oldest pending change
+        self._lock = threading.Lock()
+
+        # Make sure nothing is lost if the run ends without close()
+        atexit.register(self._flush_and_report)
+
+    def modify(self, message_id, add_labels=(), remove_labels=()):
+        """Queue a label change for a message."""
+        with self._lock:
+            add, remove = self._pending.get(message_id, (set(), set()))
+
+            # Later changes win over earlier ones for the same label
+            add = (add - set(remove_labels)) | set(add_labels)
+            remove = (remove - set(add_labels)) | set(remove_labels)
+            self._pending[message_id] = (add, remove)
+
+            if self._timer is None:
+                self._start_timer()
+
+            should_flush = len(self._pending) >= self.max_ids
+
+        if should_flush:
+            self.flush()
+
+    def mark_read(self, message_id):
+        """Queue removing the UNREAD label."""
+        self.modify(message_id, remove_labels=['UNREAD'])
+
+    def mark_unread(self, message_id):
+        """Queue adding the UNREAD label."""
+        self.modify(message_id, add_labels=['UNREAD'])
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self):
+        """
+        Send all pending changes with batchModify.
+
+        Changes that fail are kept in the buffer so a later flush can retry them.
+
+        Returns:
+            int: Number of messages whose changes were applied
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        # Group messages that need exactly the same change
+        groups = {}
+        for message_id, (add, remove) in pending.items():
+            key = (tuple(sorted(add)), tuple(sorted(remove)))
+            groups.setdefault(key, []).append(message_id)
+
+        applied = 0
+        failed = {}
+
+        for (add, remove), message_ids in groups.items():
+            for i in range(0, len(message_ids), self.max_ids):
+                chunk = message_ids[i:i + self.max_ids]
+                body = {'ids': chunk}
+                if add:
+                    body['addLabelIds'] = list(add)
+                if remove:
+                    body['removeLabelIds'] = list(remove)
+
+                try:
+                    execute(self.service, self.service.users().messages().batchModify(
+                        userId='me',
+                        body=body
+                    ), 'messages.batchModify')
+                    applied += len(chunk)
+                except Exception as e:
+                    print(f"Error updating labels for {len(chunk)} emails: {e}")
+                    for message_id in chunk:
+                        failed[message_id] = pending[message_id]
+
+        if failed:
+            with self._lock:
+                # Newer changes queued meanwhile take priority. Failed ones wait
+                # for the next flush rather than a timer of their own, so a
+                # closed buffer doesn't keep retrying in the background
+                for message_id, change in failed.items():
+                    self._pending.setdefault(message_id, change)
+
+        return applied
+
+    def _start_timer(self):
+        # Called with the lock held, when the first change is queued
+        self._timer = threading.Timer(self.flush_interval, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def close(self):
+        """Flush at the end of a run and stop watching for process exit."""
+        atexit.unregister(self._flush_and_report)
+        self._flush_and_report()
+
+    def _flush_and_report(self):
+        """Flush, and say which emails are left if some changes still failed."""
+        self.flush()
+
+        if self._pending:
+            print(f"Label changes for {len(self._pending)} emails could not be applied: "
+                  f"{', '.join(self._pending)}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
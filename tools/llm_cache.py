@@ -0,0 +1,158 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+WHITESPACE = re.compile(r'\s+')
+
+
+class LLMCache:
+    """
+    Disk-backed cache of LLM results, shared between runs and processes.
+
+    Entries live in a small SQLite database, so the CLI and Streamlit
+    workers can use the same file safely. Entries expire after ttl_seconds,
+    and once there are more than max_entries the least recently used ones
+    are dropped. Hit/miss counters are kept for the current process.
+    """
+
+    def __init__(self, path, max_entries=5000, ttl_seconds=7 * 24 * 3600):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT, created REAL, last_used REAL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per operation keeps this safe across threads
+        conn = sqlite3.connect(str(self.path), timeout=10)
+        try:
+            with conn:  # Commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """
+        Look up a cached result.
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, created FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+
+                if row is not None and now - row[1] > self.ttl_seconds:
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    row = None
+
+                if row is not None:
+                    conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            print(f"Error reading LLM cache: {e}")
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """Store a result and evict old entries if the cache is full."""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, created, last_used) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, now)
+                )
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            print(f"Error writing LLM cache: {e}")
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl_seconds,))
+
+        count = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM entries ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def stats(self):
+        """
+        Cache counters for this process.
+
+        Returns:
+            dict: hits, misses, hit_rate and entries (stored on disk)
+        """
+        try:
+            with self._connect() as conn:
+                entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries
+        }
+
+
+def normalize_text(text):
+    """Collapse whitespace so formatting-only differences share a cache entry."""
+    return WHITESPACE.sub(' ', text or '').strip()
+
+
+def cache_key(stage, messages, model, extra=None):
+    """
+    Build the cache key for one LLM call.
+
+    The rendered messages are hashed, rather than the email and the prompt
+    template, so any change to what is actually sent (prompt wording, how
+    the email is cleaned or trimmed to its token budget, thread context)
+    invalidates old entries automatically.
+
+    Args:
+        stage: Name of the call (e.g. 'analyze', 'generate')
+        messages: Chat messages sent to the LLM
+        model: Model name
+        extra: Anything else that changes the output
+
+    Returns:
+        str: Hex digest
+    """
+    payload = {
+        'stage': stage,
+        'model': model,
+        'messages': [[type(message).__name__, normalize_text(message.content)] for message in messages],
+        'extra': extra,
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
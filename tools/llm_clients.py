@@ -0,0 +1,123 @@
+import asyncio
+import os
+import threading
+import time
+from langchain_groq import ChatGroq
+from config.settings import GROQ_API_KEY, MODEL_NAME
+from tools.llm_scheduler import drop_scheduler
+
+DEFAULT_TEMPERATURE = 0.3
+
+
+class LLMClientRegistry:
+    """
+    Shared LLM clients, one per (api_key, model, temperature, timeout).
+
+    Clients are created the first time they're asked for and reused after
+    that, so their HTTP connection pools are reused too. A client that
+    hasn't been used for idle_seconds is dropped, so users who left don't
+    keep clients (and their keys) in memory in a long-running process;
+    once a key has no clients left, its rate-limit scheduler goes too.
+    """
+
+    def __init__(self, idle_seconds=900):
+        self.idle_seconds = idle_seconds
+        self._clients = {}  # key -> [client, last used]
+        self._lock = threading.Lock()
+
+    def get(self, api_key=None, model=None, temperature=DEFAULT_TEMPERATURE, timeout=None):
+        """
+        Get the client for a key/model/temperature, creating it if needed.
+
+        Args:
+            api_key: Groq API key (defaults to GROQ_API_KEY, read at call time)
+            model: Model name (defaults to MODEL_NAME)
+            temperature: Sampling temperature
+            timeout: Request timeout in seconds (None = library default)
+
+        Returns:
+            ChatGroq client
+        """
+        api_key = api_key or os.getenv("GROQ_API_KEY") or GROQ_API_KEY
+        model = model or MODEL_NAME
+        key = (api_key, model, temperature, timeout)
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict_idle(now)
+
+            entry = self._clients.get(key)
+            if entry is None:
+                client = ChatGroq(
+                    api_key=api_key,
+                    model=model,
+                    temperature=temperature,
+                    request_timeout=timeout,
+                    max_retries=0  # Retries are done by LLMRouter, under the rate limits
+                )
+                entry = [client, now]
+                self._clients[key] = entry
+            entry[1] = now
+            return entry[0]
+
+    def _evict_idle(self, now):
+        idle = [key for key, (_, last_used) in self._clients.items()
+                if now - last_used > self.idle_seconds]
+        for key in idle:
+            del self._clients[key]
+
+        active_keys = {key[0] for key in self._clients}
+        for api_key in {key[0] for key in idle} - active_keys:
+            drop_scheduler(api_key)
+
+    def evict_idle(self):
+        """Drop clients that haven't been used for idle_seconds."""
+        with self._lock:
+            self._evict_idle(time.monotonic())
+
+    def clear(self):
+        """Drop every client."""
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+
+_registry = LLMClientRegistry()
+
+
+def get_llm(api_key=None, model=None, temperature=DEFAULT_TEMPERATURE, timeout=None):
+    """Get a shared LLM client from the process-wide registry (see LLMClientRegistry.get)."""
+    return _registry.get(api_key, model, temperature, timeout)
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def llm_loop():
+    """
+    The process-wide event loop for async LLM calls, running in its own thread.
+
+    Clients are kept for many runs, and their async connection pools belong
+    to the loop they were first used on; a connection reused from another
+    (closed) loop fails. So sync code runs every async LLM call on this one
+    loop instead of creating a loop per run.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='llm-loop', daemon=True).start()
+        return _loop
+
+
+def run_async(coroutine):
+    """
+    Run a coroutine on llm_loop() and wait for its result.
+
+    Must not be called from llm_loop() itself; async code awaits directly.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, llm_loop()).result()
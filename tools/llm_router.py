@@ -0,0 +1,348 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from config.settings import (
+    ANALYSIS_MODEL, ANALYSIS_TEMPERATURE, ANALYSIS_MAX_TOKENS, DRAFT_MODEL, DRAFT_TEMPERATURE,
+    DRAFT_MAX_TOKENS, FALLBACK_MODEL, LLM_TIMEOUT, EXACT_TOKENIZER,
+    VIP_SENDERS, HEDGE_REQUESTS, HEDGE_PERCENTILE
+)
+from tools.llm_clients import get_llm
+from tools.llm_scheduler import email_priority, get_scheduler
+from tools.llm_stats import latency_percentile, record_call
+from tools.prompt_budget import count_message_tokens
+
+# Model settings for each LLM call the bot makes. Classification only has
+# to produce a short JSON object, so it can use a smaller, faster model.
+# max_tokens of a 'per_email' stage is multiplied by the emails in the call.
+STAGE_ROUTES = {
+    'analyze': {
+        'model': ANALYSIS_MODEL,
+        'temperature': ANALYSIS_TEMPERATURE,
+        'max_tokens': ANALYSIS_MAX_TOKENS,
+    },
+    'analyze_batch': {
+        'model': ANALYSIS_MODEL,
+        'temperature': ANALYSIS_TEMPERATURE,
+        'max_tokens': ANALYSIS_MAX_TOKENS,
+        'per_email': True,
+    },
+    # Fused mode writes the reply, so it needs the drafting model
+    'fused': {
+        'model': DRAFT_MODEL,
+        'temperature': DRAFT_TEMPERATURE,
+        'max_tokens': ANALYSIS_MAX_TOKENS + DRAFT_MAX_TOKENS,
+    },
+    'generate': {
+        'model': DRAFT_MODEL,
+        'temperature': DRAFT_TEMPERATURE,
+        'max_tokens': DRAFT_MAX_TOKENS,
+    },
+}
+
+# Threads for hedged calls made from sync code
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='llm-hedge')
+
+
+class LLMRouter:
+    """
+    Sends each LLM call to the model configured for its stage.
+
+    Calls wait their turn in the API key's LLMScheduler, so the key stays
+    under its per-minute limits and emails from VIP senders (then shorter
+    emails) go first.
+
+    With hedging on, a request that is slower than hedge_percentile of the
+    stage's recent calls gets a duplicate, and whichever answers first is
+    used. timeout is a hard deadline for a request (hedge included); past
+    it the fallback model is tried. A rate-limited or failing model is
+    retried once on the fallback model, then up to max_retries times with
+    backoff. Every call is recorded in llm_stats with its latency, tokens
+    and the model that answered.
+    """
+
+    def __init__(self, api_key=None, routes=STAGE_ROUTES, fallback_model=FALLBACK_MODEL,
+                 timeout=LLM_TIMEOUT, vip_senders=VIP_SENDERS, max_retries=3,
+                 hedge_percentile=HEDGE_PERCENTILE if HEDGE_REQUESTS else None):
+        self.api_key = api_key
+        self.routes = routes
+        self.fallback_model = fallback_model
+        self.timeout = timeout
+        self.vip_senders = vip_senders
+        self.max_retries = max_retries
+        self.hedge_percentile = hedge_percentile
+        self.scheduler = get_scheduler(api_key)
+
+    def route(self, stage):
+        """Model settings for a stage."""
+        return self.routes[stage]
+
+    def model_for(self, stage):
+        """Primary model of a stage."""
+        return self.route(stage)['model']
+
+    def max_tokens(self, stage, emails=1):
+        """Most tokens a stage's call may generate, for a call about this many emails."""
+        route = self.route(stage)
+        if route.get('per_email'):
+            return route['max_tokens'] * max(1, emails)
+        return route['max_tokens']
+
+    def _attempts(self, stage, emails=1):
+        # (client, model, max_tokens) for the primary and, if set, the fallback
+        route = self.route(stage)
+        models = [route['model']]
+        if self.fallback_model and self.fallback_model != route['model']:
+            models.append(self.fallback_model)
+
+        max_tokens = self.max_tokens(stage, emails)
+        return [
+            (get_llm(self.api_key, model, route['temperature'], self.timeout), model, max_tokens)
+            for model in models
+        ]
+
+    def _next_attempt(self, stage, error, attempts, i, retries):
+        """
+        Decide what to do after a failed call.
+
+        Returns:
+            tuple: (attempt index, retries, seconds to wait) for the next
+                   try, or None if the error should be raised
+        """
+        if not should_fail_over(error):
+            return None
+
+        if i + 1 < len(attempts):
+            print(f"LLM {stage} on {attempts[i][1]} failed ({type(error).__name__}), "
+                  f"trying {attempts[i + 1][1]}")
+            return i + 1, retries, 0.0
+
+        # Past the deadline there's no time left to retry the same model
+        if retries >= self.max_retries or is_timeout(error):
+            return None
+
+        delay = retry_delay(error, retries)
+        if is_rate_limited(error):
+            # The whole key is over its limit, not just this request
+            self.scheduler.pause(delay)
+        print(f"LLM {stage} on {attempts[i][1]} failed ({type(error).__name__}), "
+              f"retrying in {delay:.1f}s")
+        return i, retries + 1, delay
+
+    def invoke(self, stage, messages, email=None):
+        """
+        Call the LLM for a stage.
+
+        Args:
+            stage: Key into the routes (e.g. 'analyze', 'generate')
+            messages: Chat messages
+            email: Email (or list of emails) the call is for, to set its priority
+
+        Returns:
+            The LLM response
+        """
+        prompt_tokens = count_message_tokens(messages, exact=EXACT_TOKENIZER)
+        priority = email_priority(email, self.vip_senders)
+        start = time.monotonic()
+        attempts = self._attempts(stage, len(email) if isinstance(email, list) else 1)
+        i, retries = 0, 0
+
+        while True:
+            client, model, max_tokens = attempts[i]
+            tokens = prompt_tokens + max_tokens
+            self.scheduler.acquire(tokens, priority)
+            sent = time.monotonic()
+            try:
+                response, hedged, hedge_won = self._send(stage, client, messages, max_tokens,
+                                                         tokens, priority)
+            except Exception as e:
+                next_attempt = self._next_attempt(stage, e, attempts, i, retries)
+                if next_attempt is None:
+                    record_call(stage, prompt_tokens, latency=time.monotonic() - start, error=True)
+                    raise
+                i, retries, delay = next_attempt
+                if delay and not is_rate_limited(e):
+                    time.sleep(delay)
+                continue
+
+            record_call(stage, prompt_tokens, response, time.monotonic() - sent, model,
+                        failover=i > 0, hedged=hedged, hedge_won=hedge_won)
+            return response
+
+    async def ainvoke(self, stage, messages, email=None):
+        """Async version of invoke()."""
+        prompt_tokens = count_message_tokens(messages, exact=EXACT_TOKENIZER)
+        priority = email_priority(email, self.vip_senders)
+        start = time.monotonic()
+        attempts = self._attempts(stage, len(email) if isinstance(email, list) else 1)
+        i, retries = 0, 0
+
+        while True:
+            client, model, max_tokens = attempts[i]
+            tokens = prompt_tokens + max_tokens
+            await self.scheduler.aacquire(tokens, priority)
+            sent = time.monotonic()
+            try:
+                response, hedged, hedge_won = await self._asend(stage, client, messages, max_tokens,
+                                                                tokens, priority)
+            except Exception as e:
+                next_attempt = self._next_attempt(stage, e, attempts, i, retries)
+                if next_attempt is None:
+                    record_call(stage, prompt_tokens, latency=time.monotonic() - start, error=True)
+                    raise
+                i, retries, delay = next_attempt
+                if delay and not is_rate_limited(e):
+                    await asyncio.sleep(delay)
+                continue
+
+            record_call(stage, prompt_tokens, response, time.monotonic() - sent, model,
+                        failover=i > 0, hedged=hedged, hedge_won=hedge_won)
+            return response
+
+    def hedge_delay(self, stage):
+        """Seconds to wait for an answer before sending a duplicate, or None (no hedging)."""
+        if self.hedge_percentile is None:
+            return None
+        return latency_percentile(stage, self.hedge_percentile)
+
+    def _send(self, stage, client, messages, max_tokens, tokens, priority):
+        """
+        Send one request within the deadline, hedging it if it's slow.
+
+        Returns:
+            tuple: (response, hedged, hedge_won)
+        """
+        hedge_delay = self.hedge_delay(stage)
+        if hedge_delay is None:
+            # The client's own request timeout is the deadline
+            return client.invoke(messages, max_tokens=max_tokens), False, False
+
+        # Set once the request has an answer, failed or ran out of time; a
+        # hedge that is still waiting for its turn then isn't sent at all
+        settled = threading.Event()
+
+        def send(wait_turn):
+            if wait_turn:
+                self.scheduler.acquire(tokens, priority)
+                if settled.is_set():
+                    return None
+            return client.invoke(messages, max_tokens=max_tokens)
+
+        start = time.monotonic()
+        primary = _executor.submit(send, False)
+        running = {primary}
+        hedged = False
+        error = None
+
+        try:
+            while running:
+                remaining = start + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No answer within {self.timeout}s")
+
+                timeout = remaining
+                if not hedged:
+                    timeout = min(timeout, max(0.0, start + hedge_delay - time.monotonic()))
+
+                done, running = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        # The slower request can't be stopped; its answer is ignored
+                        return future.result(), hedged, future is not primary
+                    error = future.exception()
+
+                if not done and not hedged:
+                    hedged = True
+                    running.add(_executor.submit(send, True))
+
+            raise error
+        finally:
+            settled.set()
+
+    async def _asend(self, stage, client, messages, max_tokens, tokens, priority):
+        """Async version of _send(); the slower request is cancelled."""
+        hedge_delay = self.hedge_delay(stage)
+        if hedge_delay is None:
+            response = await asyncio.wait_for(client.ainvoke(messages, max_tokens=max_tokens), self.timeout)
+            return response, False, False
+
+        async def send(wait_turn):
+            if wait_turn:
+                await self.scheduler.aacquire(tokens, priority)
+            return await client.ainvoke(messages, max_tokens=max_tokens)
+
+        start = time.monotonic()
+        primary = asyncio.ensure_future(send(False))
+        running = {primary}
+        hedged = False
+        error = None
+
+        try:
+            while running:
+                remaining = start + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"No answer within {self.timeout}s")
+
+                timeout = remaining
+                if not hedged:
+                    timeout = min(timeout, max(0.0, start + hedge_delay - time.monotonic()))
+
+                done, running = await asyncio.wait(running, timeout=timeout,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), hedged, task is not primary
+                    error = task.exception()
+
+                if not done and not hedged:
+                    hedged = True
+                    running.add(asyncio.ensure_future(send(True)))
+
+            raise error
+        finally:
+            for task in running:
+                task.cancel()
+
+
+def should_fail_over(error):
+    """Check if an LLM error means 'try again or try another model' (rate limit, overload or timeout)."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+
+    status = getattr(error, 'status_code', None)
+    if status in (429, 498, 500, 502, 503, 504):
+        return True
+
+    name = type(error).__name__
+    return 'RateLimit' in name or 'Timeout' in name or 'Connection' in name
+
+
+def is_timeout(error):
+    """Check if an LLM error means the request missed its deadline."""
+    return isinstance(error, (asyncio.TimeoutError, TimeoutError)) or 'Timeout' in type(error).__name__
+
+
+def is_rate_limited(error):
+    """Check if an LLM error is a 429 rate-limit answer."""
+    return getattr(error, 'status_code', None) == 429 or 'RateLimit' in type(error).__name__
+
+
+def retry_delay(error, attempt, base_delay=1.0, max_delay=60.0):
+    """Seconds to wait before retrying: the Retry-After header, or jittered exponential backoff."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return max(0.0, float(headers.get('retry-after')))
+    except (TypeError, ValueError):
+        return random.uniform(base_delay, min(max_delay, base_delay * 2 ** (attempt + 1)))
+
+
+_default_router = None
+
+
+def get_router():
+    """Router with the default API key, shared by callers that don't pass their own."""
+    global _default_router
+    if _default_router is None:
+        _default_router = LLMRouter()
+    return _default_router
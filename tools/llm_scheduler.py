@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from email.utils import parseaddr
+from fnmatch import fnmatch
+from config.settings import LLM_RPM, LLM_TPM
+
+# How often a waiting request checks whether it may go
+POLL_SECONDS = 0.02
+
+
+class LLMScheduler:
+    """
+    Keeps LLM requests for one API key under its per-minute limits.
+
+    Each request declares its estimated tokens (prompt plus the most it may
+    generate) before it's sent. Requests wait in a priority queue until
+    sending them keeps both the requests and tokens of the last minute
+    within rpm/tpm; the lowest priority value goes first, ties in arrival
+    order. A rate-limit answer pauses everyone with pause().
+
+    Works from threads and from event loops alike (waiting is a short
+    sleep-and-check loop), so the CLI and concurrent paths share limits.
+    """
+
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM):
+        self.rpm = rpm  # 0 = no limit
+        self.tpm = tpm  # 0 = no limit
+
+        self._lock = threading.Lock()
+        self._sent = deque()  # (timestamp, tokens) over the last minute
+        self._waiting = []  # Heap of (priority, ticket number)
+        self._tickets = itertools.count()
+        self._paused_until = 0.0
+
+        self.requests = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_queue_depth = 0
+
+    def _enqueue(self, priority):
+        ticket = (priority, next(self._tickets))
+        with self._lock:
+            heapq.heappush(self._waiting, ticket)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiting))
+        return ticket
+
+    def _try_send(self, ticket, tokens):
+        """Send the ticket's request if it's first in line and fits; else return seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            while self._sent and self._sent[0][0] <= now - 60:
+                self._sent.popleft()
+
+            if self._waiting[0] != ticket:
+                return POLL_SECONDS
+            if now < self._paused_until:
+                return self._paused_until - now
+
+            wait = 0.0
+            if self.rpm and len(self._sent) >= self.rpm:
+                wait = self._sent[0][0] + 60 - now
+
+            if self.tpm and self._sent:
+                # A request bigger than the whole budget only waits for an empty window
+                needed = min(tokens, self.tpm)
+                used = sum(sent_tokens for _, sent_tokens in self._sent)
+                for sent_at, sent_tokens in self._sent:
+                    if used + needed <= self.tpm:
+                        break
+                    used -= sent_tokens
+                    wait = max(wait, sent_at + 60 - now)
+
+            if wait > 0:
+                return wait
+
+            heapq.heappop(self._waiting)
+            self._sent.append((now, tokens))
+            self.requests += 1
+            return None
+
+    def _record_wait(self, waited):
+        with self._lock:
+            if waited > POLL_SECONDS:
+                self.throttled += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def acquire(self, tokens, priority=(0,)):
+        """
+        Wait until a request of this many tokens may be sent.
+
+        Args:
+            tokens: Estimated tokens of the request
+            priority: Sort key; lower values are sent first
+
+        Returns:
+            float: Seconds waited
+        """
+        start = time.monotonic()
+        ticket = self._enqueue(priority)
+
+        while True:
+            wait = self._try_send(ticket, tokens)
+            if wait is None:
+                break
+            time.sleep(min(wait, 1.0))
+
+        waited = time.monotonic() - start
+        self._record_wait(waited)
+        return waited
+
+    async def aacquire(self, tokens, priority=(0,)):
+        """Async version of acquire()."""
+        start = time.monotonic()
+        ticket = self._enqueue(priority)
+
+        try:
+            while True:
+                wait = self._try_send(ticket, tokens)
+                if wait is None:
+                    break
+                await asyncio.sleep(min(wait, 1.0))
+        except asyncio.CancelledError:
+            self._leave(ticket)
+            raise
+
+        waited = time.monotonic() - start
+        self._record_wait(waited)
+        return waited
+
+    def _leave(self, ticket):
+        with self._lock:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+
+    def pause(self, seconds):
+        """Hold every request for a while (after a rate-limit answer)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self):
+        """
+        Queue counters for this API key.
+
+        Returns:
+            dict: requests, queue_depth (waiting now), max_queue_depth,
+                  throttled (requests that had to wait), avg_wait and max_wait
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'queue_depth': len(self._waiting),
+                'max_queue_depth': self.max_queue_depth,
+                'throttled': self.throttled,
+                'avg_wait': self.total_wait / self.requests if self.requests else 0.0,
+                'max_wait': round(self.max_wait, 2)
+            }
+
+
+_schedulers = {}  # Hash of the API key -> LLMScheduler
+_schedulers_lock = threading.Lock()
+
+
+def _account(api_key):
+    # Only a hash is kept, so the key itself leaves memory with its clients
+    if not api_key:
+        return 'default'
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+def get_scheduler(api_key=None):
+    """Get the shared LLMScheduler for an API key."""
+    account = _account(api_key)
+    with _schedulers_lock:
+        if account not in _schedulers:
+            _schedulers[account] = LLMScheduler()
+        return _schedulers[account]
+
+
+def drop_scheduler(api_key):
+    """Forget an API key's scheduler, e.g. once its clients were dropped for being idle."""
+    with _schedulers_lock:
+        _schedulers.pop(_account(api_key), None)
+
+
+def scheduler_stats():
+    """Queue counters for every API key seen by this process (keys are not shown)."""
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return [scheduler.stats() for scheduler in schedulers]
+
+
+def email_priority(email_data, vip_senders=()):
+    """
+    Priority of an email's LLM requests: VIP senders first, then shorter emails.
+
+    Args:
+        email_data: Email dict, or a list of them (a batch goes at the
+                    priority of its most urgent email)
+        vip_senders: Sender address patterns (e.g. "boss@example.com", "*@client.com")
+
+    Returns:
+        tuple: Sort key, lower goes first
+    """
+    if isinstance(email_data, list):
+        return min((email_priority(item, vip_senders) for item in email_data), default=(1, 0))
+    if not email_data:
+        return (1, 0)
+
+    address = parseaddr(email_data.get('sender', ''))[1].lower()
+    is_vip = any(fnmatch(address, pattern.strip().lower()) for pattern in vip_senders if pattern.strip())
+
+    # Length of what's actually sent; dict.get doesn't download a lazy body
+    length = len(email_data.get('clean_body') or dict.get(email_data, 'body') or
+                 email_data.get('snippet') or '')
+    return (0 if is_vip else 1, length)
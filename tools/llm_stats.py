@@ -0,0 +1,109 @@
+import math
+import threading
+from collections import Counter, defaultdict, deque
+
+# Latencies kept per stage for percentiles (and hedging decisions)
+LATENCY_WINDOW = 200
+
+
+def _new_stage():
+    return {
+        'calls': 0,
+        'errors': 0,
+        'failovers': 0,
+        'prompt_tokens': 0,
+        'input_tokens': 0,
+        'output_tokens': 0,
+        'latency_seconds': 0.0,
+        'hedges': 0,
+        'hedge_wins': 0,
+        'models': Counter()
+    }
+
+
+_lock = threading.Lock()
+_stats = defaultdict(_new_stage)
+_latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+
+
+def record_call(stage, prompt_tokens, response=None, latency=0.0, model=None, failover=False,
+                error=False, hedged=False, hedge_won=False):
+    """
+    Record one LLM call.
+
+    Args:
+        stage: Name of the call (e.g. 'analyze', 'generate')
+        prompt_tokens: Estimated prompt size, counted before sending
+        response: LLM response; its usage metadata (if any) adds the
+                  token counts reported by the provider
+        latency: Seconds the call took
+        model: Model that answered
+        failover: The stage's primary model failed and another one was used
+        error: No model answered
+        hedged: A duplicate request was sent because the first was slow
+        hedge_won: The duplicate answered first
+    """
+    usage = getattr(response, 'usage_metadata', None) or {}
+
+    with _lock:
+        stage_stats = _stats[stage]
+        stage_stats['calls'] += 1
+        stage_stats['errors'] += int(error)
+        stage_stats['failovers'] += int(failover)
+        stage_stats['prompt_tokens'] += prompt_tokens
+        stage_stats['input_tokens'] += usage.get('input_tokens', 0)
+        stage_stats['output_tokens'] += usage.get('output_tokens', 0)
+        stage_stats['latency_seconds'] += latency
+        stage_stats['hedges'] += int(hedged)
+        stage_stats['hedge_wins'] += int(hedge_won)
+        if model:
+            stage_stats['models'][model] += 1
+        if not error:
+            _latencies[stage].append(latency)
+
+
+def latency_percentile(stage, percentile, min_samples=20):
+    """
+    Recent latency of a stage at a percentile.
+
+    Args:
+        stage: Name of the call
+        percentile: 0-100
+        min_samples: Calls needed before the number means anything
+
+    Returns:
+        float: Seconds, or None if there are fewer than min_samples calls
+    """
+    with _lock:
+        latencies = sorted(_latencies[stage])
+
+    if not latencies or len(latencies) < min_samples:
+        return None
+    index = max(0, math.ceil(percentile / 100 * len(latencies)) - 1)
+    return latencies[index]
+
+
+def llm_stats():
+    """
+    Per-stage LLM usage for this process.
+
+    Returns:
+        dict: stage -> calls, errors, failovers, prompt_tokens (estimated),
+              input_tokens and output_tokens (reported by the provider),
+              latency_seconds, hedges, hedge_wins, models (calls per model),
+              avg_prompt_tokens, avg_latency and p50/p95/p99 of recent latency
+    """
+    with _lock:
+        stats = {
+            stage: {**values, 'models': dict(values['models'])}
+            for stage, values in _stats.items()
+        }
+
+    for stage, values in stats.items():
+        for percentile in (50, 95, 99):
+            values[f'p{percentile}'] = latency_percentile(stage, percentile, min_samples=1)
+
+        calls = values['calls']
+        values['avg_prompt_tokens'] = values['prompt_tokens'] / calls if calls else 0
+        values['avg_latency'] = values['latency_seconds'] / calls if calls else 0.0
+    return stats
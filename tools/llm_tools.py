@@ -1,32 +1,48 @@
-from langchain_groq import ChatGroq
 from langchain_core.messages import HumanMessage, SystemMessage
-from config.settings import GROQ_API_KEY, MODEL_NAME
+from config.settings import (
+    LLM_CONCURRENCY, ANALYSIS_TOKEN_BUDGET, RESPONSE_TOKEN_BUDGET,
+    EXACT_TOKENIZER, BATCH_ANALYSIS_SIZE, BATCH_TOKEN_BUDGET
+)
+from tools.body_cleaner import strip_quoted_text
+from tools.llm_cache import cache_key
+from tools.llm_clients import llm_loop, run_async
+from tools.llm_router import get_router
+from tools.llm_scheduler import email_priority
+from tools.prompt_budget import count_tokens, fit_to_budget
+from concurrent.futures import as_completed, wait
+import asyncio
 import json
+import threading
+import time
 
 
-llm = ChatGroq(
-        api_key=GROQ_API_KEY,
-        model=MODEL_NAME,
-        temperature=0.3
-    )
+ANALYSIS_PROMPT = """You are an email analysis assistant. Analyze the given email and provide:
+    1. should_respond: (true/false) - Should this email get a response?
+    2. tone: (formal/casual/friendly) - Appropriate tone for response
+    3. key_points: List of main points to address
+    4. urgency: (high/medium/low) - How urgent is this email?
+    5. category: (question/request/information/greeting/spam)
 
-def analyze_email(email_data: dict) -> dict:
-    """
-    Analyze email content and determine response strategy.
-    
-    Args:
-        email_data: Dict with 'sender', 'subject', 'body'
-        
-    Returns:
-        dict: Analysis with 'should_respond', 'tone', 'key_points', 'urgency'
-    """
+    Respond ONLY in JSON format.
+    Example response format:
+    {
+        "should_respond": true,
+        "tone": "formal",
+        "key_points": ["point 1", "point 2"],
+        "urgency": "medium",
+        "category": "question"
+    }"""
 
-    system_prompt = """You are an email analysis assistant. Analyze the given email and provide:
+FUSED_PROMPT = """You are an email assistant. Analyze the given email and provide:
     1. should_respond: (true/false) - Should this email get a response?
     2. tone: (formal/casual/friendly) - Appropriate tone for response
     3. key_points: List of main points to address
     4. urgency: (high/medium/low) - How urgent is this email?
     5. category: (question/request/information/greeting/spam)
+    6. draft: If should_respond is true, the reply body written in that tone:
+       addresses the key points, matches the urgency, is concise and clear,
+       ends with an appropriate sign-off, no subject line.
+       If should_respond is false, an empty string.
 
     Respond ONLY in JSON format.
     Example response format:
@@ -35,92 +51,680 @@ def analyze_email(email_data: dict) -> dict:
         "tone": "formal",
         "key_points": ["point 1", "point 2"],
         "urgency": "medium",
-        "category": "question"
+        "category": "question",
+        "draft": "Hi Sam,\\n\\nThanks for ..."
     }"""
 
+BATCH_ANALYSIS_PROMPT = """You are an email analysis assistant. You will get several emails,
+    each starting with a line "### Email <id>". For EVERY email provide:
+    1. id: The email's id, exactly as given
+    2. should_respond: (true/false) - Should this email get a response?
+    3. tone: (formal/casual/friendly) - Appropriate tone for response
+    4. key_points: List of main points to address
+    5. urgency: (high/medium/low) - How urgent is this email?
+    6. category: (question/request/information/greeting/spam)
+
+    Respond ONLY with a JSON array with one object per email.
+    Example response format:
+    [
+        {
+            "id": "18c2f0a1b2c3d4e5",
+            "should_respond": true,
+            "tone": "formal",
+            "key_points": ["point 1", "point 2"],
+            "urgency": "medium",
+            "category": "question"
+        }
+    ]"""
 
-    # Truncate body to prevent token overflow
-    body_preview = email_data['body'][:2000]
+ANALYSIS_FIELDS = ('should_respond', 'tone', 'key_points', 'urgency', 'category')
 
-    email_text = f"""
-    From: {email_data['sender']}
-    Subject: {email_data['subject']}
-    Body: {body_preview}
+RESPONSE_PROMPT = """You are a professional email response writer.
+    Generate a {tone} email response that:{key_points}
+    - Matches the urgency level: {urgency}
+    - Is concise and clear
+    - Ends with appropriate sign-off
+
+    Do not include subject line, just the body."""
+
+# Left out when there are no key points (e.g. for a speculative reply)
+KEY_POINTS_LINE = """
+    - Addresses these key points: {key_points}"""
+
+FALLBACK_RESPONSE = "Thank you for your email. I'll get back to you soon."
+
+_speculation_lock = threading.Lock()
+_speculation = {'started': 0, 'hits': 0, 'misses': 0, 'cancelled': 0, 'saved_seconds': 0.0}
+
+
+def analyze_email(email_data: dict, cache=None, client=None) -> dict:
     """
+    Analyze email content and determine response strategy.
 
-    messages = [
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=email_text)
-    ]
+    Args:
+        email_data: Dict with 'sender', 'subject', 'body'
+        cache: Optional LLMCache; a cached analysis is returned without calling the LLM
+        client: LLMRouter to use (defaults to the shared one from get_router())
+
+    Returns:
+        dict: Analysis with 'should_respond', 'tone', 'key_points', 'urgency'
+    """
+    messages = build_analysis_messages(email_data, ANALYSIS_PROMPT)
+    key, cached = _cache_lookup(cache, 'analyze', messages, client=client)
+    if cached is not None:
+        return cached
 
     try:
-        # Step 3: Get response
-        response = llm.invoke(messages)
-        response_text = response.content
-        
-        # Step 4: Parse JSON
-        # Sometimes LLM adds markdown, so clean it
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0]
-        elif "```" in response_text:
-            # Case 2: ``` ... ```
-            response_text = response_text.split("```")[1].split("```")[0]
-        
-        analysis = json.loads(response_text.strip())
+        # Get response
+        response = _client(client).invoke('analyze', messages, email=email_data)
+
+        # Parse JSON
+        analysis = parse_json_response(response.content)
+        _cache_store(cache, key, analysis)
         return analysis
-        
+
     except Exception as e:
         print(f"Error in analyze_email: {e}")
-        return {
-            "should_respond": False,
-            "tone": "formal",
-            "key_points": [],
-            "urgency": "low",
-            "category": "error"
-        }
+        return error_analysis()
+
+
+def analyze_and_respond(email_data: dict, cache=None, client=None) -> dict:
+    """
+    Analyze an email and write the reply in a single LLM call.
+
+    Saves the second round trip (and sending the email twice) for emails
+    that need a response.
 
+    Args:
+        email_data: Dict with 'sender', 'subject', 'body'
+        cache: Optional LLMCache; a cached result is returned without calling the LLM
+        client: LLMRouter to use (defaults to the shared one from get_router())
 
-def generate_response(email_data: dict, analysis: dict) -> str:
+    Returns:
+        dict: Same fields as analyze_email(), plus 'draft' with the reply
+              body ('' when should_respond is false)
+    """
+    messages = build_analysis_messages(email_data, FUSED_PROMPT)
+    key, cached = _cache_lookup(cache, 'fused', messages, client=client)
+    if cached is not None:
+        return cached
+
+    try:
+        response = _client(client).invoke('fused', messages, email=email_data)
+        analysis = parse_fused_response(response.content)
+        _cache_store(cache, key, analysis)
+        return analysis
+
+    except Exception as e:
+        print(f"Error in analyze_and_respond: {e}")
+        return {**error_analysis(), 'draft': ''}
+
+
+def generate_response(email_data: dict, analysis: dict, cache=None, client=None) -> str:
     """
     Generate email response based on analysis.
-    
+
     Args:
         email_data: Original email data
         analysis: Analysis from analyze_email()
-        
+        cache: Optional LLMCache; a cached reply is returned without calling the LLM
+        client: LLMRouter to use (defaults to the shared one from get_router())
+
     Returns:
         str: Generated email response
     """
+    messages = build_response_messages(email_data, analysis)
+    key, cached = _cache_lookup(cache, 'generate', messages, client=client)
+    if cached is not None:
+        return cached
 
-    tone = analysis.get('tone', 'professional')
-    key_points = analysis.get('key_points', [])
+    try:
+        response = _client(client).invoke('generate', messages, email=email_data)
+        _cache_store(cache, key, response.content)
+        return response.content  # Just return the text
+    except Exception as e:
+        print(f"Error generating response: {e}")
+        return FALLBACK_RESPONSE
 
-    system_prompt = f"""You are a professional email response writer. 
-    Generate a {tone} email response that:
-    - Addresses these key points: {', '.join(key_points)}
-    - Matches the urgency level: {analysis['urgency']}
-    - Is concise and clear
-    - Ends with appropriate sign-off
 
-    Do not include subject line, just the body."""
+async def aanalyze_email(email_data: dict, cache=None, client=None) -> dict:
+    """Async version of analyze_email()."""
+    messages = build_analysis_messages(email_data, ANALYSIS_PROMPT)
+    key, cached = _cache_lookup(cache, 'analyze', messages, client=client)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await _client(client).ainvoke('analyze', messages, email=email_data)
+        analysis = parse_json_response(response.content)
+        _cache_store(cache, key, analysis)
+        return analysis
+    except Exception as e:
+        print(f"Error in analyze_email: {e}")
+        return error_analysis()
+
+
+async def aanalyze_and_respond(email_data: dict, cache=None, client=None) -> dict:
+    """Async version of analyze_and_respond()."""
+    messages = build_analysis_messages(email_data, FUSED_PROMPT)
+    key, cached = _cache_lookup(cache, 'fused', messages, client=client)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await _client(client).ainvoke('fused', messages, email=email_data)
+        analysis = parse_fused_response(response.content)
+        _cache_store(cache, key, analysis)
+        return analysis
+    except Exception as e:
+        print(f"Error in analyze_and_respond: {e}")
+        return {**error_analysis(), 'draft': ''}
+
+
+async def agenerate_response(email_data: dict, analysis: dict, cache=None,
+                             client=None) -> str:
+    """Async version of generate_response()."""
+    messages = build_response_messages(email_data, analysis)
+    key, cached = _cache_lookup(cache, 'generate', messages, client=client)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await _client(client).ainvoke('generate', messages, email=email_data)
+        _cache_store(cache, key, response.content)
+        return response.content
+    except Exception as e:
+        print(f"Error generating response: {e}")
+        return FALLBACK_RESPONSE
+
+
+async def aanalyze_emails_batch(emails: list, cache=None, client=None) -> dict:
+    """
+    Analyze several emails with a single LLM request.
+
+    Saves the per-request latency and the repeated system prompt when
+    there are many short emails. Emails missing from the answer (or all of
+    them, if it isn't valid JSON) are analyzed one by one instead.
+
+    Args:
+        emails: Email dicts to analyze together (see plan_batches())
+        cache: Optional LLMCache; shares entries with analyze_email()
+        client: LLMRouter to use (defaults to the shared one from get_router())
+
+    Returns:
+        dict: Email ID -> analysis, for every email
+    """
+    results = {}
+    pending = []
+    for email_data in emails:
+        key, cached = _cache_lookup(cache, 'analyze', build_analysis_messages(email_data, ANALYSIS_PROMPT),
+                                    client=client)
+        if cached is not None:
+            results[email_data['id']] = cached
+        else:
+            pending.append((email_data, key))
+
+    if len(pending) == 1:
+        email_data, _ = pending[0]
+        results[email_data['id']] = await aanalyze_email(email_data, cache=cache, client=client)
+        return results
+
+    parsed = {}
+    if pending:
+        messages = build_batch_messages([email_data for email_data, _ in pending])
+        try:
+            response = await _client(client).ainvoke(
+                'analyze_batch', messages, email=[email_data for email_data, _ in pending]
+            )
+            parsed = parse_batch_response(response.content)
+        except Exception as e:
+            print(f"Error in batch analysis: {e}")
+
+    missing = []
+    for email_data, key in pending:
+        analysis = parsed.get(str(email_data['id']))
+        if analysis is None:
+            missing.append(email_data)
+        else:
+            _cache_store(cache, key, analysis)
+            results[email_data['id']] = analysis
+
+    if missing:
+        print(f"Batch analysis incomplete, analyzing {len(missing)} emails one by one")
+        analyses = await asyncio.gather(*(
+            aanalyze_email(email_data, cache=cache, client=client) for email_data in missing
+        ))
+        for email_data, analysis in zip(missing, analyses):
+            results[email_data['id']] = analysis
+
+    return results
+
+
+def analyze_emails_batch(emails: list, cache=None, client=None) -> dict:
+    """Sync version of aanalyze_emails_batch()."""
+    return run_async(aanalyze_emails_batch(emails, cache=cache, client=client))
+
+
+async def aprocess_email(email_data: dict, fused: bool = False, cache=None,
+                         client=None, speculate=None) -> dict:
+    """
+    Analyze an email and, if it needs one, write the reply.
+
+    Args:
+        speculate: Optional function email -> provisional tone (or None);
+                   see process_emails_concurrently()
+
+    Returns:
+        dict: {'email': email_data, 'analysis': analysis, 'draft': reply or ''}
+    """
+    if fused:
+        analysis = await aanalyze_and_respond(email_data, cache=cache, client=client)
+        draft = analysis.get('draft', '')
+    else:
+        speculation = _start_speculation(email_data, speculate, cache, client)
+        start = time.monotonic()
+        try:
+            analysis = await aanalyze_email(email_data, cache=cache, client=client)
+        except asyncio.CancelledError:
+            _cancel_speculations([speculation])
+            raise
+        draft = await _settle_speculation(speculation, analysis, time.monotonic() - start)
+
+    if analysis.get('should_respond', False) and not draft:
+        draft = await agenerate_response(email_data, analysis, cache=cache, client=client)
+
+    return {'email': email_data, 'analysis': analysis, 'draft': draft}
+
+
+async def aprocess_batch(emails: list, cache=None, client=None, speculate=None) -> list:
+    """
+    Analyze a batch of emails in one request, then write the replies.
+
+    Returns:
+        list: {'email', 'analysis', 'draft'} for each email
+    """
+    speculations = {
+        email_data['id']: _start_speculation(email_data, speculate, cache, client)
+        for email_data in emails
+    }
+    start = time.monotonic()
+    try:
+        analyses = await aanalyze_emails_batch(emails, cache=cache, client=client)
+    except asyncio.CancelledError:
+        _cancel_speculations(speculations.values())
+        raise
+    analysis_seconds = time.monotonic() - start
+
+    async def respond(email_data):
+        analysis = analyses[email_data['id']]
+        draft = await _settle_speculation(speculations[email_data['id']], analysis, analysis_seconds)
+        if analysis.get('should_respond', False) and not draft:
+            draft = await agenerate_response(email_data, analysis, cache=cache, client=client)
+        return {'email': email_data, 'analysis': analysis, 'draft': draft}
+
+    return list(await asyncio.gather(*(respond(email_data) for email_data in emails)))
+
+
+def process_emails_concurrently(emails: list, concurrency: int = LLM_CONCURRENCY,
+                                fused: bool = False, cache=None,
+                                batch_size: int = BATCH_ANALYSIS_SIZE, client=None,
+                                speculate=None):
+    """
+    Run the LLM steps for many emails at once.
+
+    Up to `concurrency` emails are in flight at a time, so a batch takes
+    about as long as its slowest few emails rather than the sum of all of
+    them. Results are yielded as soon as each email finishes (not in input
+    order), so callers can start showing or acting on them early. Emails
+    from VIP senders and shorter emails are started first.
+
+    Args:
+        emails: Email dicts to process
+        concurrency: Maximum number of emails processed at the same time
+        fused: Use the single-call analyze+generate mode
+        cache: Optional LLMCache shared by all calls
+        batch_size: Analyze up to this many emails per request (see
+                    plan_batches()); not combined with fused mode
+        client: LLMRouter to use, e.g. one with the current user's key
+                (defaults to get_router())
+        speculate: Optional function email -> provisional tone, or None.
+                   For emails it gives a tone for (ones that almost always
+                   get a reply), the reply is written in that tone while
+                   the analysis is still running, and kept only if the
+                   analysis agrees. Not combined with fused mode.
+
+    Yields:
+        dict: {'email', 'analysis', 'draft'} for each email, in completion order
+    """
+    if not emails:
+        return
+
+    # Runs on the shared LLM loop, where the clients' connections live
+    loop = llm_loop()
+
+    # The semaphore has to be created while its loop is running
+    async def make_semaphore():
+        return asyncio.Semaphore(max(1, concurrency))
+
+    semaphore = run_async(make_semaphore())
+
+    # Each unit of work is one email, or one batch of emails
+    if batch_size > 1 and not fused:
+        units = plan_batches(emails, batch_size)
+    else:
+        units = [[email_data] for email_data in emails]
+
+    # VIP senders and shorter emails start first
+    vip_senders = _client(client).vip_senders
+    units.sort(key=lambda unit: email_priority(unit, vip_senders))
+
+    async def limited(unit):
+        async with semaphore:
+            if len(unit) > 1:
+                return await aprocess_batch(unit, cache=cache, client=client, speculate=speculate)
+            return [await aprocess_email(unit[0], fused=fused, cache=cache, client=client,
+                                         speculate=speculate)]
+
+    futures = [asyncio.run_coroutine_threadsafe(limited(unit), loop) for unit in units]
+
+    try:
+        for future in as_completed(futures):
+            yield from future.result()
+    finally:
+        # Stopped early: cancel whatever is still running
+        for future in futures:
+            future.cancel()
+        wait(futures)
+
+
+def _start_speculation(email_data, speculate, cache, client):
+    """
+    Start writing a reply before the analysis is done, if speculate gives a tone.
+
+    Returns:
+        tuple: (task, provisional analysis), or None
+    """
+    tone = speculate(email_data) if speculate is not None else None
+    if tone is None:
+        return None
+
+    # Only the tone is known yet; the reply works from the email itself,
+    # with no key points line in its prompt
+    provisional = {'should_respond': True, 'tone': tone, 'key_points': [], 'urgency': 'medium'}
+
+    async def draft():
+        start = time.monotonic()
+        text = await agenerate_response(email_data, provisional, cache=cache, client=client)
+        return text, time.monotonic() - start
+
+    _record_speculation('started')
+    return asyncio.ensure_future(draft()), provisional
+
+
+async def _settle_speculation(speculation, analysis, analysis_seconds):
+    """
+    Keep a speculative reply if the analysis agrees with its guess, else drop it.
+
+    The guess agrees when the email gets a reply in the guessed tone and at
+    the guessed urgency; key points aren't guessed, the speculative reply
+    picks them from the email itself.
+
+    Args:
+        speculation: Result of _start_speculation()
+        analysis: The email's real analysis
+        analysis_seconds: How long the analysis took
+
+    Returns:
+        str: The reply, or '' if there is none to keep
+    """
+    if speculation is None:
+        return ''
+
+    task, provisional = speculation
+    agrees = (
+        analysis.get('should_respond', False)
+        and analysis.get('tone') == provisional['tone']
+        and analysis.get('urgency') == provisional['urgency']
+    )
+
+    if not agrees:
+        if not task.done():
+            task.cancel()
+            _record_speculation('cancelled')
+        await asyncio.gather(task, return_exceptions=True)
+        _record_speculation('misses')
+        return ''
+
+    draft, draft_seconds = await task
+    if draft == FALLBACK_RESPONSE:
+        _record_speculation('misses')
+        return ''
+
+    # Run one after the other, the two calls would have taken their sum
+    _record_speculation('hits', saved=min(analysis_seconds, draft_seconds))
+    return draft
+
+
+def _cancel_speculations(speculations):
+    """Stop speculative replies whose email is no longer being processed."""
+    for speculation in speculations:
+        if speculation is not None:
+            speculation[0].cancel()
+
+
+def _record_speculation(counter, saved=0.0):
+    with _speculation_lock:
+        _speculation[counter] += 1
+        _speculation['saved_seconds'] += saved
+
+
+def speculation_stats():
+    """
+    Speculative replies in this process (see process_emails_concurrently()).
+
+    Returns:
+        dict: started, hits (kept), misses (dropped), cancelled (dropped
+              before they finished), saved_seconds and hit_rate
+    """
+    with _speculation_lock:
+        stats = dict(_speculation)
+    settled = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / settled if settled else 0.0
+    return stats
+
+
+def build_analysis_messages(email_data: dict, system_prompt: str) -> list:
+    """Build the chat messages for analyze_email() / analyze_and_respond()."""
+
+    # Fit the body to the stage's token budget, keeping its beginning and end
+    body_preview = fit_to_budget(prompt_body(email_data), ANALYSIS_TOKEN_BUDGET, exact=EXACT_TOKENIZER)
+
+    email_text = f"""
+    From: {email_data['sender']}
+    Subject: {email_data['subject']}
+    Body: {body_preview}
+    """ + format_thread_context(email_data)
+
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=email_text)
+    ]
+
+
+def build_batch_messages(emails: list) -> list:
+    """Build the chat messages for aanalyze_emails_batch()."""
+    parts = []
+    for email_data in emails:
+        body_preview = fit_to_budget(prompt_body(email_data), ANALYSIS_TOKEN_BUDGET, exact=EXACT_TOKENIZER)
+        parts.append(f"""### Email {email_data['id']}
+    From: {email_data['sender']}
+    Subject: {email_data['subject']}
+    Body: {body_preview}
+    """ + format_thread_context(email_data))
+
+    return [
+        SystemMessage(content=BATCH_ANALYSIS_PROMPT),
+        HumanMessage(content="\n".join(parts))
+    ]
+
+
+def plan_batches(emails: list, batch_size: int = BATCH_ANALYSIS_SIZE,
+                 token_budget: int = BATCH_TOKEN_BUDGET) -> list:
+    """
+    Split emails into batches for aanalyze_emails_batch().
+
+    A batch holds at most batch_size emails and, past its first email, no
+    more than token_budget tokens of email bodies, so long emails end up
+    in smaller batches (or alone).
+
+    Returns:
+        list: Lists of email dicts, in input order
+    """
+    batches, current, used = [], [], 0
+
+    for email_data in emails:
+        tokens = min(count_tokens(prompt_body(email_data), exact=EXACT_TOKENIZER), ANALYSIS_TOKEN_BUDGET)
+        if current and (len(current) >= batch_size or used + tokens > token_budget):
+            batches.append(current)
+            current, used = [], 0
+        current.append(email_data)
+        used += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_response_messages(email_data: dict, analysis: dict) -> list:
+    """Build the chat messages for generate_response()."""
+
+    key_points = analysis.get('key_points', [])
+    system_prompt = RESPONSE_PROMPT.format(
+        tone=analysis.get('tone', 'professional'),
+        key_points=KEY_POINTS_LINE.format(key_points=', '.join(key_points)) if key_points else '',
+        urgency=analysis.get('urgency', 'medium')
+    )
+
+    # Fit the body to the stage's token budget, keeping its beginning and end
+    body_preview = fit_to_budget(prompt_body(email_data), RESPONSE_TOKEN_BUDGET, exact=EXACT_TOKENIZER)
 
     context = f"""
     Original Email:
     From: {email_data['sender']}
     Subject: {email_data['subject']}
-    Body: {email_data['body'][:500]}  # Limit to avoid token overflow
-    """
+    Body: {body_preview}
+    """ + format_thread_context(email_data)
 
-    messages = [
-    SystemMessage(content=system_prompt),
-    HumanMessage(content=context)
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=context)
     ]
 
-    try:
-        response = llm.invoke(messages)
-        return response.content  # Just return the text
-    except Exception as e:
-        print(f"Error generating response: {e}")
-        return "Thank you for your email. I'll get back to you soon."
-    
 
+def prompt_body(email_data: dict) -> str:
+    """
+    Email body without quoted replies, signatures and disclaimers.
+
+    Cleaned once per email and kept on the email as 'clean_body', so the
+    analysis and reply prompts share the work.
+    """
+    if 'clean_body' not in email_data:
+        email_data['clean_body'], _ = strip_quoted_text(email_data['body'])
+    return email_data['clean_body']
+
+
+def _client(client):
+    """The given LLMRouter, or the shared default one."""
+    return client if client is not None else get_router()
+
+
+def _cache_lookup(cache, stage, messages, client=None):
+    """
+    Look up the result of an LLM call (its rendered messages) in the cache.
+
+    Returns:
+        tuple: (key, cached value or None); key is None when there is no cache
+    """
+    if cache is None:
+        return None, None
+    key = cache_key(stage, messages, _client(client).model_for(stage))
+    return key, cache.get(key)
+
+
+def _cache_store(cache, key, value):
+    """Save a successful LLM result (fallbacks after errors are never cached)."""
+    if cache is not None:
+        cache.put(key, value)
+
+
+def parse_json_response(response_text: str):
+    """
+    Parse JSON from an LLM response.
+
+    Sometimes LLM adds markdown, so clean it first.
+    """
+    if "```json" in response_text:
+        response_text = response_text.split("```json")[1].split("```")[0]
+    elif "```" in response_text:
+        # Case 2: ``` ... ```
+        response_text = response_text.split("```")[1].split("```")[0]
+
+    return json.loads(response_text.strip())
+
+
+def parse_batch_response(response_text: str) -> dict:
+    """
+    Parse an aanalyze_emails_batch() response.
+
+    Returns:
+        dict: Email ID -> analysis, for the entries that have every field
+    """
+    entries = parse_json_response(response_text)
+    if isinstance(entries, dict):
+        # Some models wrap the array in an object
+        entries = next((value for value in entries.values() if isinstance(value, list)), [])
+
+    analyses = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or 'id' not in entry:
+            continue
+        if all(field in entry for field in ANALYSIS_FIELDS):
+            analyses[str(entry.pop('id'))] = entry
+    return analyses
+
+
+def parse_fused_response(response_text: str) -> dict:
+    """Parse an analyze_and_respond() response, making sure 'draft' is set."""
+    analysis = parse_json_response(response_text)
+    analysis.setdefault('draft', '')
+    return analysis
+
+
+def error_analysis() -> dict:
+    """Fallback analysis used when the LLM call fails."""
+    return {
+        "should_respond": False,
+        "tone": "formal",
+        "key_points": [],
+        "urgency": "low",
+        "category": "error"
+    }
+
+
+def format_thread_context(email_data: dict) -> str:
+    """
+    Format the earlier messages of a conversation for a prompt.
+
+    Args:
+        email_data: Email dict, optionally with 'thread_context'
+            (set by fetch_unread_threads)
+
+    Returns:
+        str: Compact summary of earlier messages, or '' if there are none
+    """
+    context = email_data.get('thread_context')
+    if not context:
+        return ''
+
+    lines = [f"- {message['sender']}: {message['snippet']}" for message in context]
+    return "\nEarlier in this conversation:\n" + "\n".join(lines) + "\n"
@@ -0,0 +1,117 @@
+import re
+
+# Ideographs and kana are roughly one token per character, other words
+# roughly one token per four characters, punctuation one token per mark
+CJK_CHARS = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+SEGMENT_PATTERN = re.compile(rf'[{CJK_CHARS}]|[^\W{CJK_CHARS}]+|[^\w\s]', re.UNICODE)
+SPACES = re.compile(r'[ \t\r\f\v\u00a0]+')
+BLANK_LINES = re.compile(r'\n\s*\n+')
+
+OMITTED_MARKER = '\n[...]\n'
+
+try:
+    import tiktoken
+except ImportError:  # Optional: exact counts for OpenAI-style BPE vocabularies
+    tiktoken = None
+
+_encoding = None
+
+
+def _exact_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        _encoding = tiktoken.get_encoding('cl100k_base')
+    return _encoding
+
+
+def _segment_cost(segment):
+    if len(segment) == 1:
+        return 1
+    return (len(segment) + 3) // 4
+
+
+def approx_tokens(text):
+    """Fast token estimate, no tokenizer needed."""
+    return sum(_segment_cost(match.group()) for match in SEGMENT_PATTERN.finditer(text or ''))
+
+
+def count_tokens(text, exact=False):
+    """
+    Count the tokens in a piece of text.
+
+    Args:
+        text: Text to count
+        exact: Use tiktoken when it's installed (falls back to the estimate)
+
+    Returns:
+        int: Token count
+    """
+    encoding = _exact_encoding() if exact else None
+    if encoding is not None:
+        return len(encoding.encode(text or ''))
+    return approx_tokens(text)
+
+
+def count_message_tokens(messages, exact=False):
+    """Token count of a list of chat messages (content only)."""
+    return sum(count_tokens(message.content, exact=exact) for message in messages)
+
+
+def compact_whitespace(text):
+    """Collapse runs of spaces and blank lines, which cost tokens but carry nothing."""
+    text = SPACES.sub(' ', text or '')
+    text = '\n'.join(line.strip() for line in text.split('\n'))
+    return BLANK_LINES.sub('\n\n', text).strip()
+
+
+def fit_to_budget(text, max_tokens, head_share=0.75, exact=False):
+    """
+    Shorten text to a token budget, keeping its beginning and end.
+
+    The start of an email usually says what it's about and the end says
+    what is being asked, so the middle is what gets dropped. Cuts fall
+    between words (or between characters for CJK text), never inside one.
+
+    Args:
+        text: Text to fit
+        max_tokens: Token budget
+        head_share: Share of the budget spent on the beginning
+        exact: Use tiktoken when it's installed
+
+    Returns:
+        str: Text within the budget, with '[...]' where the middle was cut
+    """
+    text = compact_whitespace(text)
+    if count_tokens(text, exact=exact) <= max_tokens:
+        return text
+
+    budget = max(0, max_tokens - approx_tokens(OMITTED_MARKER))
+    head_budget = int(budget * head_share)
+    tail_budget = budget - head_budget
+
+    encoding = _exact_encoding() if exact else None
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        head = encoding.decode(tokens[:head_budget])
+        tail = encoding.decode(tokens[len(tokens) - tail_budget:]) if tail_budget else ''
+        return head.rstrip() + OMITTED_MARKER + tail.lstrip()
+
+    segments = list(SEGMENT_PATTERN.finditer(text))
+
+    head_end, used = 0, 0
+    for match in segments:
+        used += _segment_cost(match.group())
+        if used > head_budget:
+            break
+        head_end = match.end()
+
+    tail_start, used = len(text), 0
+    for match in reversed(segments):
+        if match.start() < head_end:
+            break
+        used += _segment_cost(match.group())
+        if used > tail_budget:
+            break
+        tail_start = match.start()
+
+    return text[:head_end].rstrip() + OMITTED_MARKER + text[tail_start:].lstrip()
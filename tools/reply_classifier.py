@@ -0,0 +1,333 @@
+import json
+import math
+import re
+import sys
+import zlib
+from email.utils import parseaddr
+from pathlib import Path
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# History actions used as training labels
+POSITIVE_ACTIONS = {'draft_created'}
+NEGATIVE_ACTIONS = {'skipped', 'auto_skipped'}
+
+# Entries decided without the LLM are not learned from, otherwise the
+# model would just learn the rules (or its own earlier guesses)
+UNLEARNED_REASONS = ('pre-triage', 'classifier')
+
+
+class ReplyClassifier:
+    """
+    Small local model that predicts whether an email will get a reply.
+
+    Features are the sender address, sender domain and subject words,
+    hashed into a fixed-size sparse vector (no vocabulary to store).
+    Weights are learned with logistic regression trained by SGD, one
+    example at a time, so the model can keep learning from each new run
+    without retraining on the whole history.
+    """
+
+    def __init__(self, n_features=2 ** 18, learning_rate=0.1, l2=1e-4):
+        self.n_features = n_features
+        self.learning_rate = learning_rate
+        self.l2 = l2
+
+        self.weights = {}  # Feature index -> weight (sparse)
+        self.bias = 0.0
+        self.examples_seen = 0
+        self.trained_through = ''  # Timestamp of the newest history entry learned
+
+    def features(self, email_data):
+        """
+        Hashed feature indexes of an email.
+
+        Args:
+            email_data: Dict with 'sender' and 'subject'
+
+        Returns:
+            set: Feature indexes (binary features)
+        """
+        address = parseaddr(email_data.get('sender', ''))[1].lower()
+        domain = address.rsplit('@', 1)[-1] if '@' in address else ''
+
+        names = {f'from:{address}', f'domain:{domain}'}
+        subject = email_data.get('subject', '').lower()
+        if subject.startswith(('re:', 'fwd:', 'fw:')):
+            names.add('subject:reply')
+        names.update(f'word:{token}' for token in TOKEN_PATTERN.findall(subject))
+
+        return {zlib.crc32(name.encode('utf-8')) % self.n_features for name in names}
+
+    def predict_proba(self, email_data):
+        """Probability that the email gets a reply."""
+        score = self.bias + sum(self.weights.get(i, 0.0) for i in self.features(email_data))
+        return _sigmoid(score)
+
+    def predict(self, email_data):
+        """
+        Predict should_respond for an email.
+
+        Returns:
+            tuple: (should_respond, confidence between 0.5 and 1)
+        """
+        probability = self.predict_proba(email_data)
+        return probability >= 0.5, max(probability, 1 - probability)
+
+    def partial_fit(self, examples):
+        """
+        Update the model with new labelled examples (one SGD pass).
+
+        Args:
+            examples: List of (email_data, label) with label 1 (replied) or 0
+        """
+        self._sgd_pass(examples)
+        self.examples_seen += len(examples)
+
+    def fit(self, examples, epochs=5):
+        """Train on a full set of examples for a few passes."""
+        for _ in range(epochs):
+            self._sgd_pass(examples)
+        # Each example counts once, however many passes it took part in
+        self.examples_seen += len(examples)
+
+    def _sgd_pass(self, examples):
+        for email_data, label in examples:
+            indexes = self.features(email_data)
+            score = self.bias + sum(self.weights.get(i, 0.0) for i in indexes)
+            gradient = _sigmoid(score) - label
+
+            self.bias -= self.learning_rate * gradient
+            for i in indexes:
+                weight = self.weights.get(i, 0.0)
+                self.weights[i] = weight - self.learning_rate * (gradient + self.l2 * weight)
+
+    def learn_from_history(self, history):
+        """
+        Learn from history entries added since the last call.
+
+        Args:
+            history: User history list (oldest first)
+
+        Returns:
+            int: Number of new examples learned
+        """
+        new_entries = [
+            entry for entry in history
+            if entry.get('timestamp', '') > self.trained_through
+        ]
+        examples = history_examples(new_entries)
+        self.partial_fit(examples)
+
+        if new_entries:
+            self.trained_through = max(entry.get('timestamp', '') for entry in new_entries)
+        return len(examples)
+
+    def save(self, path):
+        """Save the model as JSON."""
+        data = {
+            'n_features': self.n_features,
+            'learning_rate': self.learning_rate,
+            'l2': self.l2,
+            'bias': self.bias,
+            'examples_seen': self.examples_seen,
+            'trained_through': self.trained_through,
+            # Tiny weights barely change a prediction, leave them out
+            'weights': {str(i): round(w, 6) for i, w in self.weights.items() if abs(w) > 1e-6}
+        }
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(data, f)
+        except Exception as e:
+            print(f"Error saving reply classifier: {e}")
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved model, or return a new untrained one."""
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        except Exception as e:
+            print(f"Error loading reply classifier: {e}")
+            return cls()
+
+        model = cls(data['n_features'], data['learning_rate'], data['l2'])
+        model.bias = data['bias']
+        model.examples_seen = data['examples_seen']
+        model.trained_through = data.get('trained_through', '')
+        model.weights = {int(i): w for i, w in data['weights'].items()}
+        return model
+
+
+def _sigmoid(score):
+    if score >= 0:
+        return 1 / (1 + math.exp(-score))
+    z = math.exp(score)
+    return z / (1 + z)
+
+
+def history_examples(history):
+    """
+    Turn history entries into training examples.
+
+    Returns:
+        list: (email_data, label) pairs; label 1 = draft created, 0 = skipped
+    """
+    examples = []
+    for entry in history:
+        if not _learnable(entry):
+            continue
+
+        email_data = {'sender': entry.get('sender', ''), 'subject': entry.get('email', '')}
+        examples.append((email_data, 1 if entry['action'] in POSITIVE_ACTIONS else 0))
+
+    return examples
+
+
+def _learnable(entry):
+    action = entry.get('action')
+    if action not in POSITIVE_ACTIONS and action not in NEGATIVE_ACTIONS:
+        return False
+    return not (entry.get('reason') or '').startswith(UNLEARNED_REASONS)
+
+
+def predicted_skip(email_data, model, threshold, min_examples=20):
+    """
+    Check if the model is confident enough to skip the LLM for an email.
+
+    Only "no reply needed" predictions short-circuit: a reply still needs
+    the LLM analysis for its tone and key points.
+
+    Args:
+        email_data: Email dict
+        model: ReplyClassifier
+        threshold: Confidence needed to skip
+        min_examples: Examples the model must have seen before it's trusted
+
+    Returns:
+        float: Confidence of the skip, or None if the LLM should decide
+    """
+    if model.examples_seen < min_examples:
+        return None
+
+    should_respond, confidence = model.predict(email_data)
+    if should_respond or confidence < threshold:
+        return None
+    return confidence
+
+
+def likely_reply(email_data, model, threshold, min_examples=20):
+    """
+    Check if the model is confident an email will get a reply.
+
+    Used to start writing the reply before the LLM analysis is done.
+
+    Args:
+        email_data: Email dict
+        model: ReplyClassifier
+        threshold: Reply probability needed
+        min_examples: Examples the model must have seen before it's trusted
+
+    Returns:
+        float: Reply probability, or None if it's below threshold
+    """
+    if model.examples_seen < min_examples:
+        return None
+
+    probability = model.predict_proba(email_data)
+    return probability if probability >= threshold else None
+
+
+def usual_tones(history):
+    """
+    The tone most often used in replies to each sender.
+
+    Args:
+        history: User history list (entries with a 'tone' are drafts created)
+
+    Returns:
+        dict: Sender address -> tone
+    """
+    counts = {}
+    for entry in history:
+        if entry.get('action') in POSITIVE_ACTIONS and entry.get('tone'):
+            address = parseaddr(entry.get('sender', ''))[1].lower()
+            tones = counts.setdefault(address, {})
+            tones[entry['tone']] = tones.get(entry['tone'], 0) + 1
+
+    return {address: max(tones, key=tones.get) for address, tones in counts.items()}
+
+
+def evaluate(history, threshold=0.9, holdout_share=0.2, min_examples=20):
+    """
+    Measure the classifier on held-out history.
+
+    The model learns the oldest entries with learn_from_history(), one pass
+    as the Dashboard trains it, and is tested on the newest holdout_share
+    of them, like it would be used going forward.
+
+    Args:
+        history: User history list (oldest first)
+        threshold: Confidence needed to skip the LLM
+        holdout_share: Share of examples kept for testing
+        min_examples: Training examples needed before skipping is allowed
+
+    Returns:
+        dict: train/test sizes, precision and recall of should_respond,
+              accuracy, llm_calls_avoided (share of test emails skipped) and
+              missed_replies (skipped emails that did get a reply)
+    """
+    entries = [
+        entry for entry in sorted(history, key=lambda entry: entry.get('timestamp', ''))
+        if _learnable(entry)
+    ]
+    split = int(len(entries) * (1 - holdout_share))
+
+    model = ReplyClassifier()
+    trained = model.learn_from_history(entries[:split])
+    test = history_examples(entries[split:])
+
+    true_positive = false_positive = false_negative = correct = 0
+    avoided = missed = 0
+
+    for email_data, label in test:
+        should_respond, _ = model.predict(email_data)
+        correct += int(should_respond == bool(label))
+        true_positive += int(should_respond and label == 1)
+        false_positive += int(should_respond and label == 0)
+        false_negative += int(not should_respond and label == 1)
+
+        if predicted_skip(email_data, model, threshold, min_examples) is not None:
+            avoided += 1
+            missed += label
+
+    return {
+        'train': trained,
+        'test': len(test),
+        'precision': true_positive / (true_positive + false_positive) if true_positive + false_positive else 0.0,
+        'recall': true_positive / (true_positive + false_negative) if true_positive + false_negative else 0.0,
+        'accuracy': correct / len(test) if test else 0.0,
+        'llm_calls_avoided': avoided / len(test) if test else 0.0,
+        'missed_replies': missed
+    }
+
+
+if __name__ == "__main__":
+    # Usage: python -m tools.reply_classifier path/to/history.json [threshold]
+    if len(sys.argv) < 2:
+        print("Usage: python -m tools.reply_classifier HISTORY_FILE [THRESHOLD]")
+        sys.exit(1)
+
+    with open(sys.argv[1], 'r') as f:
+        history = json.load(f)
+    threshold = float(sys.argv[2]) if len(sys.argv) > 2 else 0.9
+
+    report = evaluate(history, threshold=threshold)
+    print(f"Trained on {report['train']} emails, tested on {report['test']}")
+    print(f"Precision: {report['precision']:.2f}  Recall: {report['recall']:.2f}  "
+          f"Accuracy: {report['accuracy']:.2f}")
+    print(f"LLM calls avoided at {threshold:.0%} confidence: {report['llm_calls_avoided']:.0%} "
+          f"({report['missed_replies']} of them did get a reply)")
@@ -0,0 +1,176 @@
+import json
+import re
+from collections import Counter
+from datetime import datetime
+from email.utils import parseaddr
+from fnmatch import fnmatch
+from pathlib import Path
+
+# Each rule can be switched off, and senders can be added to either list.
+# Sender patterns are shell-style and matched against the address,
+# e.g. "*@news.example.com" or "alerts@*".
+DEFAULT_TRIAGE_RULES = {
+    'enabled': True,
+    'noreply_senders': True,  # noreply@, do-not-reply@, mailer-daemon@ ...
+    'mailing_lists': True,    # List-Unsubscribe / List-Id headers
+    'bulk_mail': True,        # Precedence: bulk/list/junk, Auto-Submitted
+    'calendar': True,         # Calendar invitations and RSVP notifications
+    'skip_senders': [],       # Always skipped
+    'allow_senders': [],      # Never skipped by these rules
+}
+
+NOREPLY_PATTERN = re.compile(
+    r'^(no[-_.]?reply|do[-_.]?not[-_.]?reply|mailer[-_.]?daemon|bounces?)([-_.+].*)?$',
+    re.IGNORECASE
+)
+# Google Calendar's subjects, e.g. "Invitation: Sync @ Mon Jun 3, 2024 10am - 11am (CEST)
+# (me@example.com)" or "Accepted: Sync @ Weekly from 10am to 11am on Monday (...)".
+# The prefix alone also starts ordinary mail ("Invitation: speak at our conference").
+CALENDAR_SUBJECT_PATTERN = re.compile(
+    r'^(invitation|updated invitation|accepted|declined|tentatively accepted|'
+    r'cancell?ed event|event canceled)( with note)?: .+ @ '
+    r'(mon|tue|wed|thu|fri|sat|sun|daily|weekly|monthly|yearly|annually|every)',
+    re.IGNORECASE
+)
+CALENDAR_SENDERS = ['calendar-notification@google.com', '*@calendar-server.bounces.google.com']
+BULK_PRECEDENCE = {'bulk', 'list', 'junk'}
+
+
+def load_triage_rules(rules_file=None):
+    """
+    Load pre-triage rules, filling in defaults for anything not set.
+
+    Args:
+        rules_file: Optional JSON file with rule overrides
+
+    Returns:
+        dict: Rules in the DEFAULT_TRIAGE_RULES format
+    """
+    rules = dict(DEFAULT_TRIAGE_RULES)
+
+    if rules_file and Path(rules_file).exists():
+        try:
+            with open(rules_file, 'r') as f:
+                rules.update(json.load(f))
+        except Exception as e:
+            print(f"Error loading triage rules: {e}")
+
+    return rules
+
+
+def sender_address(email_data):
+    """Lower-case address part of the sender ('Name <a@b.com>' -> 'a@b.com')."""
+    return parseaddr(email_data.get('sender', ''))[1].lower()
+
+
+def triage_email(email_data, rules=DEFAULT_TRIAGE_RULES):
+    """
+    Decide from headers alone whether an email can skip the LLM.
+
+    Only the sender, subject, headers and part types are used, so this
+    never loads the body of a lazily fetched email.
+
+    Args:
+        email_data: Email dict from parse_email()
+        rules: Rules in the DEFAULT_TRIAGE_RULES format
+
+    Returns:
+        str: Name of the rule that matched (the email should be skipped),
+             or None if the email needs the LLM
+    """
+    if not rules.get('enabled', True):
+        return None
+
+    address = sender_address(email_data)
+    headers = {name.lower(): value for name, value in email_data.get('headers', {}).items()}
+
+    if _matches_any(address, rules.get('allow_senders', [])):
+        return None
+
+    if _matches_any(address, rules.get('skip_senders', [])):
+        return 'skip_sender'
+
+    if rules.get('noreply_senders') and NOREPLY_PATTERN.match(address.split('@')[0]):
+        return 'noreply_sender'
+
+    if rules.get('calendar') and (
+        _matches_any(address, CALENDAR_SENDERS)
+        or email_data.get('has_calendar')
+        or CALENDAR_SUBJECT_PATTERN.match(email_data.get('subject', '').strip())
+    ):
+        return 'calendar'
+
+    if rules.get('bulk_mail'):
+        if headers.get('precedence', '').strip().lower() in BULK_PRECEDENCE:
+            return 'bulk_mail'
+        auto_submitted = headers.get('auto-submitted', '').strip().lower()
+        if auto_submitted and auto_submitted != 'no':
+            return 'bulk_mail'
+
+    if rules.get('mailing_lists') and ('list-unsubscribe' in headers or 'list-id' in headers):
+        return 'mailing_list'
+
+    return None
+
+
+def _matches_any(address, patterns):
+    return any(fnmatch(address, pattern.strip().lower()) for pattern in patterns if pattern.strip())
+
+
+def log_triage_decision(log_file, email_data, reason):
+    """
+    Append one pre-triage decision to a JSON-lines log.
+
+    Args:
+        log_file: Log file path
+        email_data: The email that was triaged
+        reason: Rule that matched, or None if the email went to the LLM
+    """
+    entry = {
+        'timestamp': datetime.now().isoformat(),
+        'id': email_data.get('id'),
+        'sender': email_data.get('sender', ''),
+        'subject': email_data.get('subject', ''),
+        'decision': 'skip' if reason else 'llm',
+        'reason': reason
+    }
+
+    try:
+        Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(log_file, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+    except Exception as e:
+        print(f"Error writing triage log: {e}")
+
+
+def summarize_triage_log(log_file):
+    """
+    Count the decisions in a pre-triage log.
+
+    Returns:
+        dict: total, skipped (LLM calls saved), saved_share and by_reason
+    """
+    total = 0
+    by_reason = Counter()
+
+    try:
+        with open(log_file, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                total += 1
+                if entry.get('decision') == 'skip':
+                    by_reason[entry.get('reason')] += 1
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Error reading triage log: {e}")
+
+    skipped = sum(by_reason.values())
+    return {
+        'total': total,
+        'skipped': skipped,
+        'saved_share': skipped / total if total else 0.0,
+        'by_reason': dict(by_reason)
+    }
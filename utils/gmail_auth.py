@@ -1,40 +1,129 @@
 import os.path
+import threading
+from datetime import datetime, timedelta, timezone
 
+import google_auth_httplib2
+import httplib2
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
 from config.settings import CREDENTIALS_FILE, TOKEN_FILE, GMAIL_SCOPES
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = GMAIL_SCOPES
 
+# Refresh the access token when it has less than this left
+REFRESH_MARGIN = timedelta(minutes=5)
 
-def get_gmail_service():
+# One service per account (token file), built once per process
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_gmail_service(token_file=TOKEN_FILE, scopes=SCOPES, interactive=True):
   """
     Authenticates with Gmail API and returns service object.
+
+    The service is built once per account and reused, so calling this for
+    every email is cheap. The discovery document bundled with the client
+    library is used instead of downloading it, and the token is only
+    refreshed when it is about to expire. httplib2 isn't thread-safe, so
+    each thread sends its requests over its own connection (see
+    _request_builder); the service itself can be shared by threads.
+
+    Args:
+        token_file: Path of the account's token.json
+        scopes: OAuth scopes to request
+        interactive: Open the browser login flow if there is no valid token
     
     Returns:
         service: Authenticated Gmail API service
     """
+  token_file = str(token_file)
+
+  with _services_lock:
+    entry = _services.get(token_file)
+    if entry is None:
+      creds = _load_credentials(token_file, scopes, interactive)
+      service = build(
+          "gmail", "v1", http=_authorized_http(creds), requestBuilder=_request_builder(creds),
+          static_discovery=True, cache_discovery=False
+      )
+      # Quota is tracked per account, keyed by its token file
+      service.quota_account = token_file
+      entry = _services[token_file] = {
+          'service': service, 'creds': creds, 'lock': threading.Lock()
+      }
+
+  creds = entry['creds']
+  if _needs_refresh(creds):
+    # Only one caller refreshes; the others wait and then reuse the new token
+    with entry['lock']:
+      if _needs_refresh(creds):
+        creds.refresh(Request())
+        _save_credentials(token_file, creds)
+
+  return entry['service']
+
+
+def forget_gmail_service(token_file=TOKEN_FILE):
+  """Drop the cached service for an account (e.g. after its token changed)."""
+  with _services_lock:
+    _services.pop(str(token_file), None)
+
 
+def _authorized_http(creds):
+  return google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http())
+
+
+def _request_builder(creds):
+  """Build API requests that use one Http per thread, sharing the credentials."""
+  local = threading.local()
+
+  def build_request(http, *args, **kwargs):
+    if not hasattr(local, 'http'):
+      local.http = _authorized_http(creds)
+    return HttpRequest(local.http, *args, **kwargs)
+
+  return build_request
+
+
+def _load_credentials(token_file, scopes, interactive):
+  """Load the account's credentials, logging in if needed and allowed."""
   creds = None
-  if os.path.exists(TOKEN_FILE):
-    creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+  if os.path.exists(token_file):
+    creds = Credentials.from_authorized_user_file(token_file, scopes)
   # If there are no (valid) credentials available, let the user log in.
   if not creds or not creds.valid:
     if creds and creds.expired and creds.refresh_token:
       creds.refresh(Request())
-    else:
+    elif interactive:
       flow = InstalledAppFlow.from_client_secrets_file(
-          CREDENTIALS_FILE, SCOPES
+          CREDENTIALS_FILE, scopes
       )
       creds = flow.run_local_server(port=0)
+    else:
+      raise Exception("User is not authenticated with Gmail")
       
     # Save the credentials for the next run
-    with open(TOKEN_FILE, "w") as token:
-      token.write(creds.to_json())
+    _save_credentials(token_file, creds)
+
+  return creds
+
+
+def _needs_refresh(creds):
+  """Check if the access token expires within REFRESH_MARGIN."""
+  if not creds.refresh_token:
+    return False
+  if creds.expiry is None:
+    return not creds.token
+  # google-auth keeps expiry as a naive UTC datetime
+  now = datetime.now(timezone.utc).replace(tzinfo=None)
+  return creds.expiry - now < REFRESH_MARGIN
 
-  service = build("gmail", "v1", credentials=creds)  
 
-  return service
+def _save_credentials(token_file, creds):
+  with open(token_file, "w") as token:
+    token.write(creds.to_json())
@@ -0,0 +1,132 @@
+import json
+import os
+import uuid
+from pathlib import Path
+
+
+class MessageStore:
+    """
+    On-disk store of downloaded Gmail messages, keyed by message ID.
+
+    Gmail message IDs never change content, so a message only needs to be
+    downloaded once. Each message is kept in its own JSON file holding the
+    Gmail payload, and is only read from disk when asked for. Only the raw
+    payload is kept (callers parse it on every read), so parser fixes apply
+    to stored messages too. When the store grows past max_bytes, the least
+    recently used messages are removed.
+
+    Files are written to a temp file and renamed into place, so the CLI and
+    Streamlit processes can share one store without seeing partial writes.
+    """
+
+    def __init__(self, root, max_bytes=200 * 1024 * 1024):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        # Size estimate for this process, corrected by every eviction scan
+        self._size = None
+
+    def _path(self, message_id):
+        """File path for a message (sharded to keep directories small)."""
+        return self.root / message_id[-2:] / f"{message_id}.json"
+
+    def get(self, message_id):
+        """
+        Load a stored message.
+
+        Returns:
+            dict: {'payload': Gmail message resource}, or None if the
+                  message isn't stored
+        """
+        path = self._path(message_id)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Mark as recently used for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return entry
+
+    def get_payload(self, message_id):
+        """Load just the Gmail message resource, or None if not stored."""
+        entry = self.get(message_id)
+        return entry['payload'] if entry else None
+
+    def put(self, message_id, payload):
+        """
+        Store a downloaded message.
+
+        Args:
+            message_id: Gmail message ID
+            payload: Gmail message resource as returned by the API (format='full')
+        """
+        path = self._path(message_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        data = json.dumps({'payload': payload})
+
+        # Unique temp name so concurrent writers never share a file
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error storing message {message_id}: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return
+
+        if self._size is None:
+            self._size = self._scan_size()
+        else:
+            self._size += len(data)
+
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def __contains__(self, message_id):
+        return self._path(message_id).exists()
+
+    def _entries(self):
+        """List (mtime, size, path) for every stored message."""
+        entries = []
+        for path in self.root.glob('*/*.json'):
+            try:
+                stat = path.stat()
+            except OSError:
+                # Removed by another process meanwhile
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove least recently used messages until the store fits in max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+
+        # Shrink to 90% so we don't evict again on the very next put
+        target = self.max_bytes * 0.9
+
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            total -= size
+
+        self._size = total